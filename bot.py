@@ -10,30 +10,40 @@ import os
 import asyncio
 
 from config import Config
-from cogs.utils import db
+from cogs.utils import db, router
+from cogs.utils.delivery import DeliveryScheduler
+from cogs.utils.history import ChannelHistory
+from cogs.utils.snapshot import Snapshot, SnapshotError, write_snapshot
+from cogs.utils.triggers import TriggerIndex, normalize_trigger
 from cogs.utils.context import Context
 
 
-formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+log = logging.getLogger("glados")
 
-file_logger = logging.getLogger("discord")
-file_logger.setLevel(logging.DEBUG)
-file_handler = logging.FileHandler(
-    filename="glados.log", encoding="utf-8", mode="w"
-)
-file_handler.setFormatter(formatter)
-file_logger.addHandler(file_handler)
 
-logger = logging.getLogger("discord")
-logger.setLevel(logging.INFO)
-handler = logging.StreamHandler()
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+def setup_logging():
+    # This only runs when the bot is started, so processes that import
+    # this module (like offload workers, which re-run it as __mp_main__)
+    # don't truncate the log file
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
 
-log = logging.getLogger("glados")
-log.setLevel(logging.INFO)
-log.addHandler(handler)
-log.addHandler(file_handler)
+    file_logger = logging.getLogger("discord")
+    file_logger.setLevel(logging.DEBUG)
+    file_handler = logging.FileHandler(
+        filename="glados.log", encoding="utf-8", mode="w"
+    )
+    file_handler.setFormatter(formatter)
+    file_logger.addHandler(file_handler)
+
+    logger = logging.getLogger("discord")
+    logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler()
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+    log.setLevel(logging.INFO)
+    log.addHandler(handler)
+    log.addHandler(file_handler)
 
 
 initial_extensions = [
@@ -81,7 +91,28 @@ class GlaDOS(commands.Bot):
         self.console = None
         self.uptime = None
         self.session = None
-        self.trigger_words = []
+        self.trigger_index = TriggerIndex(error_rate=self.config.prefilter_error_rate)
+
+        # Set once the index has everything from the database, not just the snapshot
+        self.trigger_index_loaded = asyncio.Event()
+
+        # The last few messages in each channel, for notification context
+        self.channel_history = ChannelHistory(
+            self.loop,
+            depth=self.config.context_buffer_depth,
+            max_channels=self.config.context_buffer_channels,
+        )
+
+        # DMs go through this so bursts of them stay under the rate limits
+        self.delivery = DeliveryScheduler(
+            self.loop,
+            rate=self.config.delivery_rate,
+            burst=self.config.delivery_burst,
+        )
+
+        # Cogs add their message handlers to this instead of listening to on_message
+        self.router = router.MessageRouter(self.loop)
+        self.router.add_handler(router.COMMAND, "commands", self.process_context)
         self.loop.create_task(self.prepare_bot())
 
         # user_id: spam_amount
@@ -102,15 +133,126 @@ class GlaDOS(commands.Bot):
         self.pool = await db.Table.create_pool(self.config.database_uri)
         self.session = aiohttp.ClientSession(loop=self.loop)
 
-        # Cache a list of trigger words for lookup
-        query = "SELECT word FROM trigger_words;"
+        await self.load_trigger_index()
+        self.trigger_index_loaded.set()
+
+    async def load_trigger_index(self):
+        # Start from the snapshot if there is one, so highlights work right away
+        path = self.config.snapshot_path
+        snapshot = None
+
+        if path and os.path.isfile(path):
+            try:
+                snapshot = Snapshot(path)
+
+            except SnapshotError as e:
+                self.log.warning(f"Could not load trigger snapshot: {e}")
+
+        if snapshot:
+            self.trigger_index.attach_snapshot(snapshot)
+            self.log.info(f"Loaded trigger snapshot at watermark {snapshot.watermark}")
+
+            query = "SELECT COUNT(*) FROM trigger_words WHERE id <= $1;"
+            count = await self.pool.fetchval(query, snapshot.watermark)
+
+            if count == snapshot.rows:
+                # Nothing was removed since the snapshot, so only load what was added
+                query = """SELECT word, user_id, guild_id, channel_ids FROM trigger_words
+                           WHERE id > $1;
+                        """
+
+                records = await self.pool.fetch(query, snapshot.watermark)
+
+                for word, user_id, guild_id, channel_ids in records:
+                    self.trigger_index.add(guild_id, word, user_id, channel_ids)
+
+                self.log.info(f"Added {len(records)} trigger words since the snapshot")
+
+                if records:
+                    await self.save_trigger_snapshot()
+
+                return
+
+            self.log.info("Trigger words were removed since the snapshot, reloading")
+
+        # Snapshots only ever hold normalized words, so this only
+        # needs to happen when everything is loaded from the database
+        await self.normalize_trigger_words()
+
+        # Cache every guild's trigger words and their subscribers for lookup
+        query = "SELECT word, user_id, guild_id, channel_ids FROM trigger_words;"
 
         records = await self.pool.fetch(query)
 
-        self.trigger_words = [r[0] for r in records]
+        self.trigger_index.load(records)
+
+        self.log.info(f"Loaded {len(self.trigger_index)} trigger words")
+
+        await self.save_trigger_snapshot()
 
-        # Remove duplicates
-        self.trigger_words = list(dict.fromkeys(self.trigger_words))
+    async def normalize_trigger_words(self):
+        """Rewrites trigger words stored before triggers were normalized.
+
+        Messages are only matched in normalized form, so a stored word like
+        node.js would never match again. Words that normalize to one the user
+        already has, or to nothing at all, are removed.
+        """
+        query = "SELECT id, word, user_id, guild_id FROM trigger_words ORDER BY id;"
+        records = await self.pool.fetch(query)
+
+        # (word, user_id, guild_id) of the rows that are kept
+        kept = set()
+        updates = []
+        deletes = []
+
+        rows = [(normalize_trigger(r["word"]), r) for r in records]
+
+        # Rows that are already normalized win over ones that would become them
+        rows.sort(key=lambda row: row[0] != row[1]["word"])
+
+        for word, record in rows:
+            key = (word, record["user_id"], record["guild_id"])
+
+            if not word or key in kept:
+                deletes.append(record["id"])
+                continue
+
+            kept.add(key)
+
+            if word != record["word"]:
+                updates.append((record["id"], word))
+
+        if not updates and not deletes:
+            return
+
+        async with self.pool.acquire() as con:
+            async with con.transaction():
+                await con.execute("DELETE FROM trigger_words WHERE id = ANY($1);", deletes)
+                await con.executemany(
+                    "UPDATE trigger_words SET word=$2 WHERE id=$1;", updates
+                )
+
+        self.log.info(
+            f"Normalized {len(updates)} stored trigger words and removed {len(deletes)} duplicate or empty ones"
+        )
+
+    async def save_trigger_snapshot(self):
+        path = self.config.snapshot_path
+
+        if not path or not self.trigger_index.ready:
+            return
+
+        query = "SELECT MAX(id), COUNT(*) FROM trigger_words;"
+        watermark, count = await self.pool.fetchrow(query)
+
+        # Only save the index if it matches the database
+        if count != self.trigger_index.row_count:
+            self.log.warning(
+                f"Trigger index has {self.trigger_index.row_count} rows but the database has {count}, not saving a snapshot"
+            )
+            return
+
+        write_snapshot(path, self.trigger_index.sections(), watermark=watermark or 0)
 
     async def delete_message_in(self, message, seconds=5.0):
         await asyncio.sleep(seconds)
@@ -146,7 +288,9 @@ class GlaDOS(commands.Bot):
             return
 
         ctx = await self.get_context(message)
+        await self.process_context(ctx)
 
+    async def process_context(self, ctx):
         if ctx.command is None:
             return
 
@@ -176,6 +320,76 @@ class GlaDOS(commands.Bot):
 
         await self.invoke(ctx)
 
+    async def classify_message(self, message):
+        """Works out what kind of message this is, so it only goes to the handlers that want it.
+
+        Returns the kind and what to pass to its handlers. Commands get their
+        context, so it's only resolved once, and everything else gets the message.
+        """
+        if message.webhook_id:
+            return router.WEBHOOK, message
+
+        if message.author.bot:
+            return router.BOT, message
+
+        content = message.content
+        mention = f"<@{self.user.id}>"
+        nickname_mention = f"<@!{self.user.id}>"
+
+        if content in (mention, nickname_mention):
+            return router.MENTION, message
+
+        prefix = await self.get_prefix(message)
+
+        if isinstance(prefix, str):
+            prefix = (prefix,)
+
+        # Messages that start with the prefix but aren't commands,
+        # like "@GlaDOS did anyone deploy?", are scanned like any other
+        if content.startswith(tuple(prefix)):
+            ctx = await self.get_context(message)
+
+            if ctx.command is not None:
+                return router.COMMAND, ctx
+
+        if not message.guild:
+            return router.DM, message
+
+        return router.SCAN, message
+
+    def is_watched(self, message):
+        """Returns whether any trigger could apply in the message's channel"""
+        scanner = self.get_cog("Scanner")
+
+        # Without the scanner, nothing needs the channel's history
+        if not scanner:
+            return False
+
+        return scanner.is_watched(message.guild.id, message.channel)
+
+    async def on_message(self, message):
+        if message.guild and self.is_watched(message):
+            self.channel_history.add(message)
+
+        if message.author == self.user:
+            return
+
+        kind, item = await self.classify_message(message)
+        self.router.dispatch(kind, item)
+
+    async def on_raw_message_delete(self, payload):
+        self.channel_history.remove(payload.channel_id, payload.message_id)
+
+    async def on_raw_bulk_message_delete(self, payload):
+        for message_id in payload.message_ids:
+            self.channel_history.remove(payload.channel_id, message_id)
+
+    async def on_guild_channel_delete(self, channel):
+        self.channel_history.clear(channel.id)
+
+    async def on_guild_remove(self, guild):
+        self.channel_history.clear_guild(guild)
+
     async def on_ready(self):
         if self.uptime is None:
             self.uptime = d.now()
@@ -186,6 +400,13 @@ class GlaDOS(commands.Bot):
 
     async def logout(self):
         await super().logout()
+
+        try:
+            await self.save_trigger_snapshot()
+
+        except Exception as e:
+            self.log.warning(f"Could not save trigger snapshot: {e}")
+
         await self.pool.close()
 
     def run(self):
@@ -193,5 +414,6 @@ class GlaDOS(commands.Bot):
 
 
 if __name__ == "__main__":
+    setup_logging()
     bot = GlaDOS()
     bot.run()
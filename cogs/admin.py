@@ -7,6 +7,7 @@ import io
 import time
 from jishaku.codeblocks import codeblock_converter
 
+from .utils.triggers import GLOBAL
 from .utils.utils import TabularData, plural
 
 
@@ -294,6 +295,144 @@ class Admin(commands.Cog):
         pages = menus.MenuPages(source=ErrorSource(lines, i), clear_reactions_after=True,)
         await pages.start(ctx)
 
+    @commands.command(
+        name="router",
+        description="View how long each message handler takes",
+        hidden=True,
+    )
+    async def router_stats(self, ctx):
+        router = self.bot.router
+
+        table = TabularData()
+        table.set_columns(["Handler", "Kind", "Calls", "Errors", "Average", "Max"])
+
+        for (kind, name), stats in sorted(router.stats.items()):
+            table.add_row(
+                [
+                    name,
+                    kind,
+                    stats.calls,
+                    stats.errors,
+                    f"{stats.average * 1000:.2f}ms",
+                    f"{stats.max * 1000:.2f}ms",
+                ]
+            )
+
+        routed = ", ".join(f"{kind}: {count}" for kind, count in router.routed.most_common())
+
+        waiting = self.bot.channel_history.pending_count
+
+        await ctx.send(
+            f"```\n{table.render()}\n```\nRouted messages: {routed or 'none yet'}\n"
+            f"Notifications waiting for context: {waiting}"
+        )
+
+    @commands.command(
+        name="delivery",
+        description="View the DM queue and how long DMs take to send",
+        hidden=True,
+    )
+    async def delivery_stats(self, ctx):
+        delivery = self.bot.delivery
+
+        depths = ", ".join(
+            f"{priority}: {depth}" for priority, depth in delivery.depth_by_priority().items()
+        )
+
+        em = discord.Embed(title="DM Delivery", color=discord.Color.blurple())
+
+        em.add_field(name="Queued", value=f"{delivery.depth} ({depths})")
+        em.add_field(name="Sent", value=delivery.sent)
+        em.add_field(name="Failed", value=delivery.failed)
+        em.add_field(
+            name="Latency",
+            value=f"{delivery.average_latency * 1000:.2f}ms average, {delivery.max_latency * 1000:.2f}ms max",
+        )
+        em.add_field(
+            name="Rate limit",
+            value=f"{delivery.bucket.rate}/s, {delivery.bucket.tokens:.1f}/{delivery.bucket.capacity} tokens",
+        )
+        em.add_field(
+            name="DM channels",
+            value=f"{len(delivery.dm_channels)}/{delivery.dm_channels.maxsize} cached",
+        )
+
+        await ctx.send(embed=em)
+
+    @commands.command(
+        name="triggerindex",
+        description="View the trigger index for a server",
+        aliases=["tindex"],
+        usage="[server id]",
+        hidden=True,
+    )
+    async def trigger_index(self, ctx, guild_id: int = None):
+        index = self.bot.trigger_index
+
+        if guild_id is None and ctx.guild:
+            guild_id = ctx.guild.id
+
+        em = discord.Embed(title="Trigger Index", color=discord.Color.blurple())
+
+        global_triggers = index.get(GLOBAL)
+        servers = len(index.guilds) + index.pending_count
+
+        prefilter_memory = sum(g.prefilter.memory_size for g in index.guilds.values())
+
+        em.add_field(name="Words", value=len(index))
+
+        if global_triggers:
+            servers -= 1
+
+            em.add_field(
+                name="Global words",
+                value=f"{len(global_triggers)} in {plural(len(global_triggers.guild_counts)):server}",
+            )
+
+        em.add_field(name="Servers", value=servers)
+        em.add_field(name="Prefilter memory", value=f"{prefilter_memory} bytes")
+
+        if index.snapshot:
+            em.add_field(
+                name="Snapshot",
+                value=f"{plural(index.pending_count):server} not loaded yet",
+            )
+
+        scanner = self.bot.get_cog("Scanner")
+
+        if scanner:
+            cache = scanner.match_cache
+
+            em.add_field(
+                name="Match cache",
+                value=f"{len(cache)}/{cache.maxsize} results, {cache.hits} hits, {cache.misses} misses",
+            )
+
+        if scanner and scanner.offloader:
+            em.add_field(
+                name="Offloaded searches",
+                value=f"{scanner.offloader.offloaded} ({plural(scanner.offloader.workers):worker})",
+            )
+
+        guild_triggers = index.get(guild_id)
+
+        if guild_triggers:
+            prefilter = guild_triggers.prefilter
+
+            em.add_field(
+                name=f"Server {guild_id}",
+                value=(
+                    f"Words: {len(guild_triggers)}\n"
+                    f"Prefilter: {prefilter.memory_size} bytes, "
+                    f"{len(prefilter)}/{prefilter.capacity} keys, "
+                    f"{plural(prefilter.hash_count):hash|hashes}\n"
+                    f"Estimated false positive rate: {prefilter.false_positive_rate:.4%}"
+                ),
+                inline=False,
+            )
+
+        await ctx.send(embed=em)
+
     @commands.command(
         name="logout", description="Logs out and shuts down bot", hidden=True
     )
@@ -2,6 +2,7 @@ from discord.ext import commands
 import discord
 
 from .utils import db, human_time
+from .utils.sources import DEFAULT_SOURCES, SOURCES
 
 
 class UserConfig(db.Table, table_name="user_config"):
@@ -12,6 +13,13 @@ class UserConfig(db.Table, table_name="user_config"):
     blocked_channels = db.Column(db.Array(db.Integer(big=True)))
 
 
+class GuildConfig(db.Table, table_name="guild_config"):
+    id = db.PrimaryKeyColumn()
+
+    guild_id = db.Column(db.Integer(big=True), unique=True)
+    scan_sources = db.Column(db.Array(db.String))
+
+
 class UserConfigHelper:
     @classmethod
     def from_record(cls, record):
@@ -34,6 +42,18 @@ class NotBlocked(commands.CommandError):
     pass
 
 
+class SourceConverter(commands.Converter):
+    async def convert(self, ctx, arg):
+        source = arg.lower()
+
+        if source not in SOURCES:
+            raise commands.BadArgument(
+                f"Unknown source. Sources are: {', '.join(SOURCES)}"
+            )
+
+        return source
+
+
 class BlockConverter(commands.Converter):
     async def convert(self, ctx, arg):
         try:
@@ -54,6 +74,10 @@ class Config(commands.Cog):
 
         self.delete_timer = bot.delete_timer
 
+        # guild_id: frozenset of sources
+        # The scanner needs these for every message, so they're cached
+        self._scan_sources = {}
+
     async def cog_command_error(self, ctx, error):
         if isinstance(error, AlreadyBlocked):
             await ctx.safe_send("That user or channel is already blocked.")
@@ -74,6 +98,39 @@ class Config(commands.Cog):
 
         return UserConfigHelper.from_record(record)
 
+    async def get_scan_sources(self, guild_id):
+        sources = self._scan_sources.get(guild_id)
+
+        if sources is not None:
+            return sources
+
+        query = """SELECT scan_sources
+                   FROM guild_config
+                   WHERE guild_id=$1;
+                """
+
+        record = await self.bot.pool.fetchrow(query, guild_id)
+
+        if not record or record[0] is None:
+            sources = DEFAULT_SOURCES
+
+        else:
+            sources = frozenset(record[0])
+
+        self._scan_sources[guild_id] = sources
+        return sources
+
+    async def set_scan_sources(self, guild_id, sources):
+        query = """INSERT INTO guild_config (guild_id, scan_sources)
+                   VALUES ($1, $2)
+                   ON CONFLICT (guild_id) DO UPDATE
+                   SET scan_sources=EXCLUDED.scan_sources;
+                """
+
+        await self.bot.pool.execute(query, guild_id, sorted(sources))
+
+        self._scan_sources[guild_id] = frozenset(sources)
+
     async def block_user(self, author, user):
         query = """SELECT *
                    FROM user_config
@@ -280,6 +337,60 @@ class Config(commands.Cog):
         except NotBlocked:
             return
 
+    @commands.group(
+        description="View what is scanned for trigger words in this server",
+        invoke_without_command=True,
+    )
+    @commands.guild_only()
+    async def sources(self, ctx):
+        self.delete_timer(ctx.message)
+
+        sources = await self.get_scan_sources(ctx.guild.id)
+
+        lines = ["Message content: always scanned"]
+
+        for source in SOURCES:
+            status = "scanned" if source in sources else "not scanned"
+            lines.append(f"{source.capitalize()}: {status}")
+
+        em = discord.Embed(
+            title="Scanned sources",
+            description="\n".join(lines),
+            color=discord.Color.blurple(),
+        )
+
+        await ctx.safe_send(embed=em, delete_after=10.0)
+
+    @sources.command(
+        name="enable",
+        description="Start scanning a source for trigger words in this server",
+        usage="<embeds, attachments, or webhooks>",
+    )
+    @commands.guild_only()
+    @commands.has_permissions(manage_guild=True)
+    async def sources_enable(self, ctx, source: SourceConverter):
+        self.delete_timer(ctx.message)
+
+        sources = await self.get_scan_sources(ctx.guild.id)
+        await self.set_scan_sources(ctx.guild.id, sources | {source})
+
+        await ctx.safe_send("Successfully updated the scanned sources.")
+
+    @sources.command(
+        name="disable",
+        description="Stop scanning a source for trigger words in this server",
+        usage="<embeds, attachments, or webhooks>",
+    )
+    @commands.guild_only()
+    @commands.has_permissions(manage_guild=True)
+    async def sources_disable(self, ctx, source: SourceConverter):
+        self.delete_timer(ctx.message)
+
+        sources = await self.get_scan_sources(ctx.guild.id)
+        await self.set_scan_sources(ctx.guild.id, sources - {source})
+
+        await ctx.safe_send("Successfully updated the scanned sources.")
+
     @commands.command(description="Display your blocked list")
     async def blocked(self, ctx):
         self.delete_timer(ctx.message)
@@ -4,6 +4,8 @@ import discord
 import traceback
 import sys
 
+from .utils import router
+
 
 class HelpCommand(commands.HelpCommand):
     def get_base_embed(self):
@@ -139,23 +141,22 @@ class Meta(commands.Cog):
         bot.help_command = HelpCommand()
         bot.help_command.cog = self
 
+        bot.router.add_handler(router.MENTION, "mention", self.on_mention_msg)
+
     def cog_unload(self):
         self.bot.help_command = self._original_help_command
+        self.bot.router.remove_handler(router.MENTION, "mention")
 
-    @commands.Cog.listener("on_message")
     async def on_mention_msg(self, message):
+        # The router only sends messages that are just a mention of the bot
         if self.bot.debug:
             return
 
-        content = message.content
-        id = self.bot.user.id
-
-        if content == f"<@{id}>" or content == f"<@!{id}>":
-            await message.channel.send(
-                f"Hello and, again, welcome to the Aperture Science computer-aided enrichment center."
-                "\nIf you're curious about me, type:"
-                f" `@{self.bot.user} help`"
-            )
+        await message.channel.send(
+            f"Hello and, again, welcome to the Aperture Science computer-aided enrichment center."
+            "\nIf you're curious about me, type:"
+            f" `@{self.bot.user} help`"
+        )
 
     async def send_unexpected_error(self, ctx, error):
         self.bot.error_cache.append(error)
@@ -3,15 +3,126 @@ import discord
 
 import asyncpg
 import asyncio
+import hashlib
 import logging
-import re
-
-from .utils import db
+import typing
+
+from .utils import db, delivery, router
+from .utils.automaton import MODES, PREFIX
+from .utils.cache import ExpiringCache, LRUCache
+from .utils.digest import DigestBuffer, Highlight, merge_context
+from .utils.fuzzy import FUZZY_MARKER, MIN_FUZZY_LENGTH, is_fuzzy
+from .utils.normalize import NormalizedContent, changed_ranges
+from .utils.offload import MatchOffloader
+from .utils.patterns import is_pattern, literal_prefix
+from .utils.sources import DEFAULT_SOURCES, WEBHOOKS, MessageText
+from .utils.utils import plural
+from .utils.stemmer import STEM_MARKER, is_stem_trigger
+from .utils.triggers import (
+    GLOBAL,
+    MAX_PHRASE_WORDS,
+    MAX_TRIGGER_LENGTH,
+    GuildTriggers,
+    MIN_WORD_LENGTH,
+    candidate_words,
+    find_trigger,
+    in_scope,
+    min_length,
+    normalize_trigger,
+)
 
 
 log = logging.getLogger("glados.scanner")
 
 
+# How many channels the backfill command reads at once
+BACKFILL_CONCURRENCY = 3
+
+# The most messages the backfill command reads from one channel
+BACKFILL_CHANNEL_LIMIT = 200
+
+# How long to wait between pages of history, in seconds
+BACKFILL_PAGE_DELAY = 1.0
+
+# A digest has one field per channel, and has to fit in Discord's embed limits.
+# Channels that don't fit in one embed are sent in another.
+DIGEST_MAX_FIELDS = 25
+DIGEST_FIELD_LIMIT = 1024
+DIGEST_EMBED_LIMIT = 6000
+
+# How much of a field the jump links can take up
+DIGEST_JUMP_LIMIT = 400
+
+
+def bold_spans(content, spans):
+    """Escapes the content and bolds every (start, end) span in it.
+
+    Overlapping and touching spans are merged into one, since
+    bold markdown can't be nested. Spans past the end of the content,
+    like matches in embed text, are left out.
+    """
+    merged = []
+
+    for start, end in sorted(spans):
+        if start >= end or end > len(content):
+            continue
+
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+
+        else:
+            merged.append([start, end])
+
+    parts = []
+    position = 0
+
+    for start, end in merged:
+        parts.append(discord.utils.escape_markdown(content[position:start]))
+        parts.append(f"**{discord.utils.escape_markdown(content[start:end])}**")
+        position = end
+
+    parts.append(discord.utils.escape_markdown(content[position:]))
+
+    return "".join(parts)
+
+
+def join_lines(lines, limit):
+    """Joins (run, text, distance) lines into at most limit characters.
+
+    Whole lines are dropped instead of cutting one off, since that could
+    break its markdown. Context lines farthest from a highlight go first,
+    and highlighted lines (distance 0) only once all the context is gone.
+    Wherever lines were dropped or runs don't touch, "..." is put between them.
+    """
+
+    def render(kept):
+        parts = []
+        previous = None
+
+        for i in kept:
+            if previous is not None and (i != previous + 1 or lines[i][0] != lines[previous][0]):
+                parts.append("...")
+
+            parts.append(lines[i][1])
+            previous = i
+
+        return "\n".join(parts)
+
+    kept = list(range(len(lines)))
+    value = render(kept)
+
+    drop_order = sorted(kept, key=lambda i: (lines[i][2] == 0, -lines[i][2], -i))
+
+    for i in drop_order:
+        if len(value) <= limit:
+            break
+
+        kept.remove(i)
+        value = render(kept)
+
+    return value or "..."
+
+
 class TriggerWords(db.Table, table_name="trigger_words"):
     id = db.PrimaryKeyColumn()
 
@@ -20,11 +131,18 @@ class TriggerWords(db.Table, table_name="trigger_words"):
     guild_id = db.Column(db.Integer(big=True), index=True)
     created_at = db.Column(db.Datetime, default="now() at time zone 'utc'")
 
+    # Channels and categories the trigger is limited to, or NULL for the whole guild
+    channel_ids = db.Column(db.Array(db.Integer(big=True)))
+
+    # Global triggers have no guild_id, and NULLs never conflict in words_uniq_idx.
+    # Migrations can't make partial indexes, so the scanner also creates this on startup.
+    global_index = "CREATE UNIQUE INDEX IF NOT EXISTS global_words_uniq_idx ON trigger_words (LOWER(word), user_id) WHERE guild_id IS NULL;"
+
     @classmethod
     def create_table(cls, *, exists_ok=True):
         statement = super().create_table(exists_ok=exists_ok)
         sql = "CREATE UNIQUE INDEX IF NOT EXISTS words_uniq_idx ON trigger_words (LOWER(word), user_id, guild_id);"
-        return statement + "\n" + sql
+        return "\n".join((statement, sql, cls.global_index))
 
 
 class TriggerWord:
@@ -37,9 +155,38 @@ class TriggerWord:
         self.user_id = record["user_id"]
         self.guild_id = record["guild_id"]
         self.created_at = record["created_at"]
+        self.channel_ids = record["channel_ids"]
+
+        # Where the trigger was found in the normalized text, if it was searched for
+        self.spans = None
 
         return self
 
+    @classmethod
+    def temporary(cls, *, word, user_id, guild_id, channel_ids=None):
+        pseudo = {
+            "id": None,
+            "word": word,
+            "user_id": user_id,
+            "guild_id": guild_id,
+            "created_at": None,
+            "channel_ids": channel_ids,
+        }
+        return cls.from_record(pseudo)
+
+
+class SeenMessage:
+    """What the scanner remembers about a recent message, so edits can be diffed"""
+
+    __slots__ = ("text", "normalized", "notified")
+
+    def __init__(self, text, normalized):
+        self.text = text
+        self.normalized = normalized
+
+        # Users that already matched this message
+        self.notified = set()
+
 
 class Scanner(commands.Cog):
     def __init__(self, bot):
@@ -47,32 +194,138 @@ class Scanner(commands.Cog):
 
         self.delete_timer = bot.delete_timer
 
-    def format_message(self, message, *, highlight=None):
-        time_formatting = "%H:%M "
+        self.match_mode = bot.config.match_mode
 
-        content = discord.utils.escape_markdown(message.content)
+        if self.match_mode not in MODES:
+            log.warning(f"Unknown match mode {self.match_mode}, falling back to {PREFIX}")
+            self.match_mode = PREFIX
 
-        if highlight:
-            # Bold the word in the highlighted message
-            position = 0
-            content = list(content)
+        # Seconds that wildcard triggers can take per message
+        self.pattern_time_budget = bot.config.pattern_time_budget / 1000
+
+        if bot.config.offload_workers:
+            self.offloader = MatchOffloader(
+                workers=bot.config.offload_workers,
+                min_length=bot.config.offload_min_length,
+                min_triggers=bot.config.offload_min_triggers,
+            )
 
-            for i, letter in enumerate(content):
-                if letter.lower() == highlight[position]:
+        else:
+            self.offloader = None
 
-                    if position == len(highlight) - 1:
-                        content.insert(i - len(highlight) + 1, "**")
-                        content.insert(i + 2, "**")
+        # message_id: SeenMessage
+        # The oldest are dropped early if too many messages come in
+        self.seen_messages = ExpiringCache(
+            bot.config.edit_rescan_window, maxsize=bot.config.edit_rescan_size
+        )
 
-                        position = 0
+        self.backfill_limit = bot.config.backfill_limit
 
-                    else:
-                        position += 1
+        # (guild_id, version, content hash): matched triggers
+        # The version changes whenever a guild's triggers do,
+        # so old results are never used and just fall out of the cache
+        self.match_cache = LRUCache(bot.config.match_cache_size)
 
-                else:
-                    position = 0
+        # Highlights are sent one at a time unless there's a digest window
+        if bot.config.digest_window:
+            self.digest = DigestBuffer(bot.loop, bot.config.digest_window, self.send_digest)
+
+        else:
+            self.digest = None
+
+        self._member_guilds_task = bot.loop.create_task(self.sync_member_guilds())
+        self._global_index_task = bot.loop.create_task(self.create_global_index())
+
+        bot.router.add_handler(router.SCAN, "scanner", self.on_message)
+        bot.router.add_handler(router.WEBHOOK, "scanner", self.on_message)
+
+    def cog_unload(self):
+        self._member_guilds_task.cancel()
+        self._global_index_task.cancel()
+
+        self.bot.router.remove_handler(router.SCAN, "scanner")
+        self.bot.router.remove_handler(router.WEBHOOK, "scanner")
+
+        if self.offloader:
+            self.offloader.close()
+
+        # Don't lose highlights that are still waiting
+        if self.digest is not None:
+            self.digest.flush_all()
+
+    def update_member_guilds(self, user_id):
+        """Tells the global triggers which guilds a user is in"""
+        global_triggers = self.bot.trigger_index.get(GLOBAL)
+
+        if not global_triggers or user_id not in global_triggers.user_words:
+            return
+
+        guild_ids = [g.id for g in self.bot.guilds if g.get_member(user_id)]
+        global_triggers.set_user_guilds(user_id, guild_ids)
+
+    def update_all_member_guilds(self):
+        global_triggers = self.bot.trigger_index.get(GLOBAL)
+
+        if not global_triggers:
+            return
+
+        for user_id in list(global_triggers.user_words):
+            self.update_member_guilds(user_id)
+
+    async def sync_member_guilds(self):
+        await self.bot.wait_until_ready()
+
+        # The index is usable as soon as the snapshot is attached, but
+        # loading the rest can replace the global triggers or add to them
+        await self.bot.trigger_index_loaded.wait()
+
+        self.update_all_member_guilds()
+
+    async def create_global_index(self):
+        # The pool is ready once the index has loaded
+        await self.bot.trigger_index_loaded.wait()
+
+        try:
+            await self.bot.pool.execute(TriggerWords.global_index)
+
+        except asyncpg.PostgresError as e:
+            # Duplicate global triggers from before the index existed stop it from being made
+            log.warning(f"Could not create the global trigger index: {e}")
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.update_member_guilds(member.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.update_member_guilds(member.id)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.update_all_member_guilds()
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.update_all_member_guilds()
+
+    def format_message(self, message, *, highlight=None, normalized=None, spans=None):
+        time_formatting = "%H:%M "
+
+        if highlight:
+            # Bold the word in the highlighted message
+            normalized = normalized or NormalizedContent(message.content)
 
-            content = "".join(content)
+            # The scan already found where the triggers are,
+            # so the message is only searched again if it wasn't scanned
+            if spans is None:
+                spans = find_trigger(normalized.text, highlight, mode=self.match_mode)
+
+            content = bold_spans(
+                message.content, [normalized.original_span(start, end) for start, end in spans]
+            )
+
+        else:
+            content = discord.utils.escape_markdown(message.content)
 
         sent = message.created_at.strftime(time_formatting)
         timezone = message.created_at.strftime("%Z")
@@ -91,8 +344,9 @@ class Scanner(commands.Cog):
 
         return formatted
 
-    async def send_notification(self, message, word, record):
-        trigger_word = TriggerWord.from_record(record)
+    async def send_notification(
+        self, message, word, trigger_word, *, normalized=None, spans=None
+    ):
         user = self.bot.get_user(trigger_word.user_id)
 
         log.info(
@@ -107,7 +361,6 @@ class Scanner(commands.Cog):
             log.info(f"User {user} is the message author, aborting")
             return
 
-        guild = message.guild
         channel = message.channel
 
         if user.id not in [m.id for m in channel.members]:
@@ -136,70 +389,56 @@ class Scanner(commands.Cog):
         log.info(f"Building notification for message {message.id}")
 
         log.info(f"Getting list of previous messages for message {message.id}")
-        # Get a list of messages that meet certain requirements
-        matching_messages = [
-            m
-            for m in reversed(self.bot.cached_messages)
-            if m.channel == channel
-            and m.created_at <= message.created_at
-            and m.id != message.id
-        ]
-
-        # Get the first three messages in that list
-        previous_messages = matching_messages[:3]
-
-        messages = []
-
-        for msg in reversed(previous_messages):
-            messages.append(self.format_message(msg))
-
-        log.info(f"Adding trigger message for message {message.id}")
-
-        messages.append(self.format_message(message, highlight=word))
+        history = self.bot.channel_history
+        previous_messages = history.before(message, 3)
 
         # See if there are any messages after
 
         log.info(f"Getting list of next messages for message {message.id}")
-        # First, see if there are any messages after that have already been sent
-        next_messages = []
-
-        matching_messages = [
-            m
-            for m in reversed(self.bot.cached_messages)
-            if m.channel == channel
-            and m.created_at >= message.created_at
-            and m.id != message.id
-        ]
+        # Take the messages already sent, and wait a bit for the rest
+        next_messages = await history.wait_after(message, 2, timeout=5.0)
+
+        log.info(f"Found {len(next_messages)} next messages for message {message.id}")
+
+        highlight = Highlight(
+            message,
+            word,
+            normalized=normalized,
+            spans=spans,
+            before=previous_messages,
+            after=next_messages,
+        )
 
-        # If there are messages already sent, append those and continue
-        if len(matching_messages) > 2:
-            log.info(f"Found 2+ cached messages for message {message.id}")
-            next_messages.append(matching_messages[0])
-            next_messages.append(matching_messages[1])
+        if self.digest is not None:
+            log.info(f"Adding message {message.id} to the digest for user {user}")
+            self.digest.add(user, highlight)
 
-        # Otherwise, add the cached message(s)
-        # and/or wait for the remaining message(s)
         else:
-            log.info(f"Found {len(matching_messages)} cached messages for message {message.id}")
-            for msg in matching_messages:
-                next_messages.append(msg)
+            await self.send_highlight(user, highlight)
+
+    async def send_highlight(self, user, highlight):
+        message = highlight.message
+        word = highlight.word
+        channel = message.channel
 
-            def check(ms):
-                return ms.channel == channel and ms.id != message.id and ms.created_at > message.created_at
+        messages = []
 
-            # Waiting for next messages
-            for i in range(2 - len(matching_messages)):
-                log.info(f"Waiting for message {i+1}/{2-len(matching_messages)} for message {message.id}")
-                try:
-                    msg = await self.bot.wait_for("message", timeout=5.0, check=check)
-                    log.info(f"Found message {i+1}/{2-len(matching_messages)} (ID: {msg.id}) for message {message.id}")
-                    next_messages.append(msg)
+        for msg in highlight.before:
+            messages.append(self.format_message(msg))
 
-                except asyncio.TimeoutError:
-                    log.info(f"Timed out while waiting for message {i+1}/{2-len(matching_messages)} for message {message.id}")
+        log.info(f"Adding trigger message for message {message.id}")
+
+        messages.append(
+            self.format_message(
+                message,
+                highlight=word,
+                normalized=highlight.normalized,
+                spans=highlight.spans,
+            )
+        )
 
         # Add the next messages to the formatted list
-        for msg in next_messages:
+        for msg in highlight.after:
             messages.append(self.format_message(msg))
 
         em = discord.Embed(
@@ -217,87 +456,503 @@ class Scanner(commands.Cog):
         msg = (
             f"I found a trigger word: **{word}**\n"
             f"Channel: {channel.mention}\n"
-            f"Server: {guild}"
+            f"Server: {message.guild}"
         )
 
         log.info(f"Sending notification to user {user} for message {message.id}")
 
         try:
-            await user.send(msg, embed=em)
+            await self.bot.delivery.send(user, msg, embed=em)
             log.info(f"Successfully sent notification to user {user} for message {message.id}")
 
         except (discord.HTTPException, discord.Forbidden):
             log.info(f"Could not send notification to user {user} for message {message.id}")
 
-    async def get_trigger_words(self, message, word, already_seen):
+    async def send_digest(self, user, highlights):
+        if len(highlights) == 1:
+            return await self.send_highlight(user, highlights[0])
+
+        words = []
+
+        for highlight in highlights:
+            if highlight.word not in words:
+                words.append(highlight.word)
+
+        merged = merge_context(highlights)
+
+        # (name, value) for each channel
+        fields = []
+
+        for channel, channel_highlights, runs in merged:
+            highlighted = {h.message.id: h for h in channel_highlights}
+
+            # (run, text, distance from the nearest highlight)
+            lines = []
+
+            for run_number, run in enumerate(runs):
+                positions = [i for i, msg in enumerate(run) if msg.id in highlighted]
+
+                for i, msg in enumerate(run):
+                    highlight = highlighted.get(msg.id)
+                    distance = min(abs(i - p) for p in positions)
+
+                    if highlight:
+                        text = self.format_message(
+                            msg,
+                            highlight=highlight.word,
+                            normalized=highlight.normalized,
+                            spans=highlight.spans,
+                        )
+
+                    else:
+                        text = self.format_message(msg)
+
+                    lines.append((run_number, text, distance))
+
+            jumps = self.format_jumps(channel_highlights)
+            value = join_lines(lines, DIGEST_FIELD_LIMIT - len(jumps) - 1)
+
+            fields.append((f"#{channel} in {channel.guild}"[:256], f"{value}\n{jumps}"))
+
+        # Fields that don't fit in one embed go in another DM
+        title = f"Trigger words: {', '.join(words)}"[:256]
+        footer = "Last message sent"
+        timestamp = max(h.message.created_at for h in highlights)
+
+        embeds = []
+        em = None
+
+        for name, value in fields:
+            size = len(name) + len(value)
+
+            if (
+                em is None
+                or len(em.fields) >= DIGEST_MAX_FIELDS
+                or length + size > DIGEST_EMBED_LIMIT
+            ):
+                em = discord.Embed(
+                    title=title if not embeds else f"{title[:240]} (continued)",
+                    color=discord.Color.blurple(),
+                    timestamp=timestamp,
+                )
+                em.set_footer(text=footer)
+                embeds.append(em)
+                length = len(em.title) + len(footer)
+
+            em.add_field(name=name, value=value, inline=False)
+            length += size
+
+        msg = f"I found {len(highlights)} trigger words in {plural(len(merged)):channel}"
+
+        log.info(
+            f"Sending digest of {len(highlights)} highlights in {plural(len(embeds)):embed} to user {user}"
+        )
+
+        for i, em in enumerate(embeds):
+            try:
+                await self.bot.delivery.send(user, msg if i == 0 else None, embed=em)
+
+            except (discord.HTTPException, discord.Forbidden):
+                log.info(f"Could not send digest {i + 1}/{len(embeds)} to user {user}")
+
+        log.info(f"Finished sending digest to user {user}")
+
+    def format_jumps(self, highlights):
+        """Returns jump links to the highlighted messages, as many as fit in a digest field"""
+        jumps = []
+        length = 0
+
+        for i, highlight in enumerate(highlights):
+            jump = f"[Jump]({highlight.message.jump_url})"
+
+            # Leave room for the "and x more" at the end
+            if length + len(jump) + 1 > DIGEST_JUMP_LIMIT - 20:
+                jumps.append(f"and {len(highlights) - i} more")
+                break
+
+            jumps.append(jump)
+            length += len(jump) + 1
+
+        return " ".join(jumps)
+
+    async def get_trigger_words(self, guild_id, words, *, channel=None):
+        """Fetches every user subscribed to any of the words in one query.
+
+        Returns a dict of user_id: :class:`TriggerWord`.
+        """
         query = """SELECT * FROM trigger_words
-                   WHERE word=$1 AND guild_id=$2;
+                   WHERE word = ANY($1) AND (guild_id=$2 OR guild_id IS NULL);
                 """
 
-        records = await self.bot.pool.fetch(query, word, message.guild.id)
+        records = await self.bot.pool.fetch(query, list(words), guild_id)
+
+        trigger_words = {}
 
         for record in records:
-            log.info(f"Word: {word} | Found record for user {record['user_id']} for message {message.id}")
+            user_id = record["user_id"]
+            log.info(f"Word: {record['word']} | Found record for user {user_id}")
+
+            if user_id in trigger_words:
+                log.info(f"Word: {record['word']} | User {user_id} already matched, aborting")
+                continue
+
+            if not in_scope(record["channel_ids"], channel):
+                log.info(f"Word: {record['word']} | User {user_id} isn't watching #{channel}, aborting")
+                continue
+
+            # Global triggers only apply in guilds the user is in
+            if record["guild_id"] is None and not (
+                channel and channel.guild.get_member(user_id)
+            ):
+                continue
+
+            trigger_words[user_id] = TriggerWord.from_record(record)
+
+        return trigger_words
+
+    async def resolve_trigger_words(self, guild_id, text, *, channel=None):
+        """Finds every user subscribed to a trigger in the text using the index.
+
+        Returns a dict of user_id: :class:`TriggerWord`.
+        """
+        trigger_words = {}
+        content_hash = None
+
+        for guild_triggers in self.get_guild_triggers(guild_id):
+            # Spam and copy-pasted messages are only matched once
+            if content_hash is None:
+                content_hash = hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+            key = (guild_triggers.guild_id, guild_triggers.version, content_hash)
+            matched = self.match_cache.get(key)
+
+            if matched is None:
+                matched = self.match_cache[key] = await self.search_triggers(guild_triggers, text)
+
+            for word, spans in matched.items():
+                for user_id in guild_triggers.subscribers(word, channel):
+                    # Users are notified about their first trigger,
+                    # but all of their triggers are highlighted
+                    if user_id in trigger_words:
+                        trigger_words[user_id].spans.extend(spans)
+                        continue
+
+                    trigger_word = TriggerWord.temporary(
+                        word=word, user_id=user_id, guild_id=guild_triggers.guild_id or None
+                    )
+                    trigger_word.spans = list(spans)
+                    trigger_words[user_id] = trigger_word
+
+        return trigger_words
+
+    async def search_triggers(self, guild_triggers, text):
+        """Returns a dict of trigger: (start, end) spans, in the order they were found"""
+        # Every trigger is found in one pass over the message.
+        # Long messages in guilds with lots of triggers are matched
+        # in another process, so they don't block the event loop.
+        if self.offloader and self.offloader.should_offload(guild_triggers, text):
+            matched = await self.offloader.search(
+                guild_triggers, text, mode=self.match_mode, budget=self.pattern_time_budget
+            )
 
-            if record["user_id"] not in already_seen:
-                self.bot.loop.create_task(self.send_notification(message, word, record))
-                return record["user_id"]
+        else:
+            matched = guild_triggers.search(
+                text, mode=self.match_mode, budget=self.pattern_time_budget
+            )
 
-            else:
-                log.info(f"Word: {word} | User {record['user_id']} has already seen message {message.id}, aborting")
-                return None
+        spans = {}
+
+        for start, end, word in matched:
+            spans.setdefault(word, []).append((start, end))
+
+        return {word: tuple(found) for word, found in spans.items()}
+
+    def get_guild_triggers(self, guild_id):
+        """Returns the guild's triggers and the global triggers, if any apply in the guild"""
+        index = self.bot.trigger_index
+        triggers = []
+
+        guild_triggers = index.get(guild_id)
+
+        if guild_triggers:
+            triggers.append(guild_triggers)
+
+        global_triggers = index.get(GLOBAL)
+
+        if global_triggers and global_triggers.applies_in(guild_id):
+            triggers.append(global_triggers)
+
+        return triggers
+
+    async def find_trigger_words(self, guild_id, text, *, channel=None):
+        """Finds every user subscribed to a trigger in normalized text.
+
+        If a channel is given, triggers scoped to other channels are left out.
+        Returns a dict of user_id: :class:`TriggerWord`.
+        """
+        if self.bot.trigger_index.ready:
+            return await self.resolve_trigger_words(guild_id, text, channel=channel)
+
+        # The index is still loading, so look up
+        # all the words in the text in one query instead
+        words = candidate_words(text, mode=self.match_mode)
+
+        if not words:
+            return {}
+
+        return await self.get_trigger_words(guild_id, words, channel=channel)
+
+    def is_watched(self, guild_id, channel):
+        """Returns whether any trigger could apply in a channel"""
+        # Without the index, it's up to the database
+        if not self.bot.trigger_index.ready:
+            return True
+
+        return any(t.watches(channel) for t in self.get_guild_triggers(guild_id))
+
+    def notify(self, message, trigger_words, *, normalized):
+        for trigger_word in trigger_words:
+            # Create a task so the notifications are sent concurrently
+            # and not one at a time
+            self.bot.loop.create_task(
+                self.send_notification(
+                    message,
+                    trigger_word.word,
+                    trigger_word,
+                    normalized=normalized,
+                    spans=trigger_word.spans if normalized else None,
+                )
+            )
+
+    async def get_scan_sources(self, guild_id):
+        config = self.bot.get_cog("Config")
+
+        if not config:
+            return DEFAULT_SOURCES
+
+        return await config.get_scan_sources(guild_id)
 
-    @commands.Cog.listener()
     async def on_message(self, message):
-        if message.author.bot:
+        # The router only sends guild messages from users and webhooks,
+        # and leaves out commands
+        if not message.guild:
             return
 
-        # Check if the word is in the trigger words cache
-        # Create a task so I can run the queries and send the messages concurrently
-        # and not one at a time
+        if not self.is_watched(message.guild.id, message.channel):
+            return
 
-        already_seen = []
+        sources = await self.get_scan_sources(message.guild.id)
 
-        for trigger in self.bot.trigger_words:
-            for word in message.content.lower().split(" "):
-                match = re.search(trigger, word)
+        # Webhooks relay messages for people, so they can be scanned too
+        if message.webhook_id and WEBHOOKS not in sources:
+            return
 
-                if not match:
-                    continue
+        # The content, embeds, and attachment names are all matched in one pass,
+        # so a user is only notified once no matter where their trigger is
+        text = MessageText.from_message(message)
 
-                span = match.span()
+        # Normalize and tokenize the message once for everything below
+        normalized = NormalizedContent(text.scan_text(sources))
 
-                start_index = span[0]
+        # Remember the message before searching, so an edit
+        # that comes in during the search is diffed against it
+        seen = SeenMessage(text, normalized)
+        self.seen_messages[message.id] = seen
 
-                if start_index > 0:
+        if not normalized:
+            return
+
+        trigger_words = await self.find_trigger_words(
+            message.guild.id, normalized.text, channel=message.channel
+        )
+
+        trigger_words = {
+            user_id: trigger_word
+            for user_id, trigger_word in trigger_words.items()
+            if user_id not in seen.notified
+        }
+
+        seen.notified.update(trigger_words)
+
+        self.notify(message, trigger_words.values(), normalized=normalized)
+
+    async def get_edited_message(self, payload):
+        message = self.bot.channel_history.get(payload.channel_id, payload.message_id)
+
+        if message:
+            return message
+
+        channel = self.bot.get_channel(payload.channel_id)
+
+        if not channel:
+            return None
+
+        try:
+            return await channel.fetch_message(payload.message_id)
+
+        except discord.HTTPException:
+            return None
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload):
+        if "guild_id" not in payload.data:
+            return
+
+        # Only messages sent recently are remembered. Anything older
+        # can't be diffed, and rescanning it would notify people twice.
+        seen = self.seen_messages.get(payload.message_id)
+
+        if not seen:
+            return
+
+        # Link previews are added with an edit that only has the embeds
+        text = seen.text.edited(payload.data)
+
+        if text == seen.text:
+            return
+
+        guild_id = int(payload.data["guild_id"])
+        channel = self.bot.get_channel(payload.channel_id)
+
+        # Scopes and global triggers can't be checked without the channel
+        if not channel or not self.is_watched(guild_id, channel):
+            return
+
+        sources = await self.get_scan_sources(guild_id)
+
+        seen.text = text
+        normalized = NormalizedContent(text.scan_text(sources))
+
+        # Phrases can start or end in the words around a change
+        ranges = changed_ranges(seen.normalized, normalized, context=MAX_PHRASE_WORDS - 1)
+
+        seen.normalized = normalized
+
+        if not ranges:
+            return
+
+        trigger_words = {}
+
+        # Only the changed words are searched
+        for first, last in ranges:
+            offset, window = normalized.window(first, last)
+
+            found = await self.find_trigger_words(guild_id, window, channel=channel)
+
+            for user_id, trigger_word in found.items():
+                if user_id in seen.notified:
                     continue
 
-                user = await self.get_trigger_words(message, trigger, already_seen)
-                if user:
-                    already_seen.append(user)
+                # The spans are in the window, so move them to the whole text
+                if trigger_word.spans is not None:
+                    trigger_word.spans = [(s + offset, e + offset) for s, e in trigger_word.spans]
 
-    @commands.command(
-        name="add",
-        description="Add a word to your triggers",
-        usage="[word]",
-    )
-    async def _add(self, ctx, *word):
-        self.delete_timer(ctx.message)
+                if user_id in trigger_words:
+                    if trigger_words[user_id].spans is not None and trigger_word.spans:
+                        trigger_words[user_id].spans.extend(trigger_word.spans)
 
-        if len(word) > 1:
-            raise commands.BadArgument("You can only add single words to your triggers.")
+                else:
+                    trigger_words[user_id] = trigger_word
 
-        word = word[0].lower().strip()
+        if not trigger_words:
+            return
 
-        if len(word) < 3:
-            raise commands.BadArgument("Your word is too small. Must be three or more characters.")
+        message = await self.get_edited_message(payload)
 
-        query = """INSERT INTO trigger_words (word, user_id, guild_id)
-                   VALUES ($1, $2, $3);
-                """
+        if not message:
+            return
+
+        if message.author.bot and not (message.webhook_id and WEBHOOKS in sources):
+            return
+
+        # Only count users as notified once the message is confirmed.
+        # Another edit could have notified some of them while it was fetched.
+        trigger_words = {
+            user_id: trigger_word
+            for user_id, trigger_word in trigger_words.items()
+            if user_id not in seen.notified
+        }
+
+        if not trigger_words:
+            return
+
+        seen.notified.update(trigger_words)
+
+        log.info(f"Found {len(trigger_words)} new triggers in edit of message {message.id}")
+
+        # The message could have been edited again while it was fetched
+        if message.content != text.content:
+            normalized = None
+
+        self.notify(message, trigger_words.values(), normalized=normalized)
+
+    def validate_trigger(self, word):
+        """Normalizes a trigger and makes sure it can be added"""
+        word = normalize_trigger(word)
+
+        if not word or word in (FUZZY_MARKER, STEM_MARKER):
+            raise commands.BadArgument("Your trigger has to have letters or numbers in it.")
+
+        if is_fuzzy(word):
+            fuzzy = word[len(FUZZY_MARKER) :]
+
+            if " " in fuzzy:
+                raise commands.BadArgument("Fuzzy triggers can only be single words.")
+
+            if len(fuzzy) < MIN_FUZZY_LENGTH:
+                raise commands.BadArgument(
+                    "Your word is too small. Fuzzy triggers must be four or more characters."
+                )
+
+        elif is_stem_trigger(word):
+            stemmed = word[len(STEM_MARKER) :]
+
+            if " " in stemmed:
+                raise commands.BadArgument("Stem triggers can only be single words.")
+
+            if len(stemmed) < MIN_WORD_LENGTH:
+                raise commands.BadArgument(
+                    "Your word is too small. Must be three or more characters."
+                )
+
+        elif is_pattern(word) and len(literal_prefix(word)) < min_length(word):
+            raise commands.BadArgument(
+                "Wildcard triggers have to start with three or more characters "
+                "(two in scripts like Chinese and Japanese)."
+            )
+
+        if word.count(" ") >= MAX_PHRASE_WORDS:
+            raise commands.BadArgument(
+                f"Your phrase is too long. Must be {MAX_PHRASE_WORDS} words or less."
+            )
+
+        if len(word) < min_length(word):
+            raise commands.BadArgument(
+                "Your word is too small. Must be three or more characters "
+                "(two in scripts like Chinese and Japanese)."
+            )
 
+        if len(word) > MAX_TRIGGER_LENGTH:
+            raise commands.BadArgument(
+                f"Your trigger is too long. Must be {MAX_TRIGGER_LENGTH} characters or less."
+            )
+
+        return word
+
+    async def add_trigger(self, ctx, word, guild_id):
+        """Adds a trigger for the author. A guild_id of None adds a global trigger."""
+        word = self.validate_trigger(word)
+
+        # The unique indexes catch duplicates, but check here too
+        # in case the global index couldn't be created
         query = """INSERT INTO trigger_words (word, user_id, guild_id)
-                   VALUES ($1, $2, $3);
+                   SELECT $1, $2, $3
+                   WHERE NOT EXISTS (
+                       SELECT 1 FROM trigger_words
+                       WHERE LOWER(word)=LOWER($1) AND user_id=$2
+                       AND guild_id IS NOT DISTINCT FROM $3
+                   )
+                   RETURNING id;
                 """
 
         async with ctx.db.acquire() as con:
@@ -305,49 +960,293 @@ class Scanner(commands.Cog):
             await tr.start()
 
             try:
-                await ctx.db.execute(query, word, ctx.author.id, ctx.guild.id)
+                inserted = await con.fetchval(query, word, ctx.author.id, guild_id)
 
             except asyncpg.UniqueViolationError:
-                await tr.rollback()
-                await ctx.safe_send(f"You already have this trigger registered.")
+                inserted = None
 
             except Exception:
                 await tr.rollback()
                 await ctx.safe_send(f"Could not add that word to your list. Sorry.")
+                return
+
+            if inserted is None:
+                await tr.rollback()
+                await ctx.safe_send(f"You already have this trigger registered.")
 
             else:
                 await tr.commit()
 
-                if word not in self.bot.trigger_words:
-                    self.bot.trigger_words.append(word)
+                self.bot.trigger_index.add(guild_id, word, ctx.author.id)
+
+                if guild_id is None:
+                    self.update_member_guilds(ctx.author.id)
 
                 await ctx.safe_send(f"Successfully updated your triggers.")
 
-    @commands.command(
-        name="remove",
-        description="Remove a word from your triggers",
-        usage="[word]",
-    )
-    async def _remove(self, ctx, word):
-        self.delete_timer(ctx.message)
+    async def remove_trigger(self, ctx, word, guild_id):
+        """Removes a trigger for the author. A guild_id of None removes a global trigger."""
+        word = normalize_trigger(word)
 
         query = """DELETE FROM trigger_words
-                   WHERE word=$1 AND user_id=$2 AND guild_id=$3
-                   RETURNING id;
+                   WHERE word=$1 AND user_id=$2 AND guild_id IS NOT DISTINCT FROM $3
+                   RETURNING word;
                 """
-        deleted = await ctx.db.fetchrow(
-            query, word.lower(), ctx.author.id, ctx.guild.id
-        )
+        deleted = await ctx.db.fetch(query, word, ctx.author.id, guild_id)
 
-        if deleted is None:
+        if not deleted:
             await ctx.safe_send(f"That word isn't in your triggers.")
 
         else:
-            if word in self.bot.trigger_words:
-                self.bot.trigger_words.pop(self.bot.trigger_words.index(word))
+            # The word stays in the guild's index while anyone else still has it
+            for record in deleted:
+                self.bot.trigger_index.remove(guild_id, record["word"], ctx.author.id)
 
             await ctx.safe_send("Successfully updated your triggers.")
 
+    @commands.command(
+        name="add",
+        description="Add a word or phrase to your triggers",
+        usage="[word or phrase]",
+        help=(
+            "Use * to match any letters and ? to match one letter, like `deploy*`\n"
+            "Start a word with ~ to also match typos of it, like `~deploy`\n"
+            "Start a word with + to also match its other forms, like `+mouse`"
+        ),
+    )
+    async def _add(self, ctx, *, word):
+        self.delete_timer(ctx.message)
+
+        await self.add_trigger(ctx, word, ctx.guild.id)
+
+    @commands.command(
+        name="remove",
+        description="Remove a word or phrase from your triggers",
+        usage="[word or phrase]",
+    )
+    async def _remove(self, ctx, *, word):
+        self.delete_timer(ctx.message)
+
+        await self.remove_trigger(ctx, word, ctx.guild.id)
+
+    @commands.command(
+        name="addglobal",
+        description="Add a word or phrase to your triggers in every server you're in",
+        aliases=["gadd"],
+        usage="[word or phrase]",
+    )
+    async def _add_global(self, ctx, *, word):
+        self.delete_timer(ctx.message)
+
+        await self.add_trigger(ctx, word, None)
+
+    @commands.command(
+        name="removeglobal",
+        description="Remove a word or phrase from your triggers in every server",
+        aliases=["gremove"],
+        usage="[word or phrase]",
+    )
+    async def _remove_global(self, ctx, *, word):
+        self.delete_timer(ctx.message)
+
+        await self.remove_trigger(ctx, word, None)
+
+    async def backfill_messages(self, ctx, word):
+        """Reads recent history in every channel the author can see.
+
+        Returns a list of (message, normalized content, spans) for messages the word is in.
+        """
+        matcher = GuildTriggers(None)
+        matcher.add(word, ctx.author.id)
+
+        sources = await self.get_scan_sources(ctx.guild.id)
+        me = ctx.guild.me
+
+        channels = [
+            c
+            for c in ctx.guild.text_channels
+            if c.permissions_for(ctx.author).read_message_history
+            and c.permissions_for(me).read_message_history
+        ]
+
+        # Busy channels first, so they're read before the limit runs out
+        channels.sort(key=lambda c: c.last_message_id or 0, reverse=True)
+
+        semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+        matches = []
+        scanned = 0
+
+        async def scan_channel(channel):
+            nonlocal scanned
+
+            async with semaphore:
+                # Other channels may have used up the limit while this one waited
+                remaining = self.backfill_limit - scanned
+
+                if remaining <= 0:
+                    return
+
+                read = 0
+                limit = min(BACKFILL_CHANNEL_LIMIT, remaining)
+
+                async for message in channel.history(limit=limit):
+                    if scanned >= self.backfill_limit:
+                        return
+
+                    scanned += 1
+                    read += 1
+
+                    # History is fetched 100 messages at a time,
+                    # so wait a bit before the next page is requested
+                    if read % 100 == 0:
+                        await asyncio.sleep(BACKFILL_PAGE_DELAY)
+
+                    if message.author == ctx.author:
+                        continue
+
+                    if message.author.bot and not (message.webhook_id and WEBHOOKS in sources):
+                        continue
+
+                    text = MessageText.from_message(message)
+                    normalized = NormalizedContent(text.scan_text(sources))
+
+                    if not normalized:
+                        continue
+
+                    spans = [
+                        (start, end)
+                        for start, end, _ in matcher.search(normalized.text, mode=self.match_mode)
+                    ]
+
+                    if spans:
+                        matches.append((message, normalized, spans))
+
+        await asyncio.gather(*(scan_channel(c) for c in channels))
+
+        log.info(f"Backfill for {ctx.author} read {scanned} messages and found {len(matches)}")
+
+        return matches
+
+    @commands.command(
+        name="backfill",
+        description="Find recent messages with one of your triggers that you missed",
+        usage="[word or phrase]",
+    )
+    @commands.guild_only()
+    @commands.max_concurrency(1, commands.BucketType.user)
+    @commands.cooldown(1, 300.0, commands.BucketType.user)
+    async def _backfill(self, ctx, *, word):
+        self.delete_timer(ctx.message)
+
+        word = self.validate_trigger(word)
+
+        await ctx.safe_send("Looking through recent messages. I'll DM you what I find.")
+
+        matches = await self.backfill_messages(ctx, word)
+
+        matches.sort(key=lambda m: m[0].created_at, reverse=True)
+
+        em = discord.Embed(
+            title=f"Recent messages with: {word}",
+            color=discord.Color.blurple(),
+        )
+
+        lines = []
+        length = 0
+
+        for message, normalized, spans in matches:
+            formatted = self.format_message(
+                message, highlight=word, normalized=normalized, spans=spans
+            )
+            line = (
+                f"{formatted}\n"
+                f"[Jump]({message.jump_url}) in {message.channel.mention}"
+            )
+
+            # Embed descriptions can only be 2048 characters
+            if length + len(line) + 2 > 2048:
+                break
+
+            lines.append(line)
+            length += len(line) + 2
+
+        em.description = "\n\n".join(lines) or "I didn't find any recent messages with that trigger."
+        em.set_footer(text=f"Found {plural(len(matches)):message} in {ctx.guild}")
+
+        try:
+            # Someone is waiting on this, so it goes ahead of notifications
+            await self.bot.delivery.send(ctx.author, embed=em, priority=delivery.HIGH)
+
+        except discord.HTTPException:
+            await ctx.safe_send("I couldn't DM you. Do you have DMs turned off?")
+
+    @commands.command(
+        name="scope",
+        description="Only watch for one of your triggers in some channels or categories",
+        usage="<word or \"phrase\"> [channels or categories...]",
+        help="Leave out the channels to watch for the trigger in the whole server again",
+    )
+    async def _scope(
+        self,
+        ctx,
+        word,
+        *channels: typing.Union[discord.TextChannel, discord.CategoryChannel],
+    ):
+        self.delete_timer(ctx.message)
+
+        # Triggers added before normalization are only lowercased
+        words = list({normalize_trigger(word), word.lower()})
+        channel_ids = sorted({c.id for c in channels}) or None
+
+        # The row is added again instead of updated, so the trigger
+        # snapshot sees that it changed. See bot.load_trigger_index.
+        delete = """DELETE FROM trigger_words
+                    WHERE word = ANY($1) AND user_id=$2 AND guild_id=$3
+                    RETURNING word, created_at;
+                 """
+
+        insert = """INSERT INTO trigger_words (word, user_id, guild_id, created_at, channel_ids)
+                    VALUES ($1, $2, $3, $4, $5);
+                 """
+
+        async with ctx.db.acquire() as con:
+            async with con.transaction():
+                record = await con.fetchrow(delete, words, ctx.author.id, ctx.guild.id)
+
+                if record:
+                    await con.execute(
+                        insert,
+                        record["word"],
+                        ctx.author.id,
+                        ctx.guild.id,
+                        record["created_at"],
+                        channel_ids,
+                    )
+
+        if not record:
+            return await ctx.safe_send("That word isn't in your triggers.")
+
+        self.bot.trigger_index.add(ctx.guild.id, record["word"], ctx.author.id, channel_ids)
+
+        await ctx.safe_send("Successfully updated your triggers.")
+
+    def format_scope(self, guild, channel_ids):
+        if not channel_ids:
+            return ""
+
+        names = []
+
+        for channel_id in channel_ids:
+            channel = guild.get_channel(channel_id)
+
+            if isinstance(channel, discord.CategoryChannel):
+                names.append(channel.name)
+
+            else:
+                names.append(channel.mention if channel else str(channel_id))
+
+        return f" (in {', '.join(names)})"
+
     @commands.command(
         name="all",
         description="View all your triggers for this server",
@@ -356,8 +1255,9 @@ class Scanner(commands.Cog):
     async def _all(self, ctx):
         self.delete_timer(ctx.message)
 
-        query = """SELECT word FROM trigger_words
-                   WHERE user_id=$1 AND guild_id=$2;
+        query = """SELECT word, guild_id, channel_ids FROM trigger_words
+                   WHERE user_id=$1 AND (guild_id=$2 OR guild_id IS NULL)
+                   ORDER BY guild_id NULLS FIRST;
                 """
 
         records = await ctx.db.fetch(query, ctx.author.id, ctx.guild.id)
@@ -365,7 +1265,14 @@ class Scanner(commands.Cog):
         if not records:
             return await ctx.safe_send("You have no triggers for this server.")
 
-        words = "\n".join([r[0] for r in records])
+        words = "\n".join(
+            [
+                f"{r['word']} (global)"
+                if r["guild_id"] is None
+                else f"{r['word']}{self.format_scope(ctx.guild, r['channel_ids'])}"
+                for r in records
+            ]
+        )
 
         em = discord.Embed(title="Your Triggers", description=words, color=discord.Color.blurple())
 
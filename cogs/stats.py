@@ -137,7 +137,8 @@ class Stats(commands.Cog):
             self._trigger_data_batch.append(
                 {
                     "word": trigger.word,
-                    "guild": trigger.guild_id,
+                    # Global triggers have no guild_id, so use where the message was sent
+                    "guild": message.guild.id,
                     "channel": message.channel.id,
                     "author": message.author.id,
                     "uid": trigger.user_id,
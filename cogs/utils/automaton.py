@@ -0,0 +1,157 @@
+import collections
+
+from .normalize import is_unspaced
+
+
+# Match modes for Automaton.search
+# prefix: the trigger has to be at the start of a word (the original behaviour)
+# word: the trigger has to be a whole word
+# substring: the trigger can be anywhere
+PREFIX = "prefix"
+WORD = "word"
+SUBSTRING = "substring"
+
+MODES = (PREFIX, WORD, SUBSTRING)
+
+
+def is_boundary(text, index):
+    """Returns whether the character at the index separates words"""
+    return index < 0 or index >= len(text) or text[index].isspace()
+
+
+def is_word_start(text, index):
+    """Returns whether a word can start at the index.
+
+    Scripts like Chinese and Japanese don't put spaces between words,
+    so a word can start anywhere next to one of their characters.
+    """
+    return (
+        is_boundary(text, index - 1)
+        or is_unspaced(text[index - 1])
+        or (index < len(text) and is_unspaced(text[index]))
+    )
+
+
+def is_word_end(text, index):
+    """Returns whether a word can end right before the index"""
+    return (
+        is_boundary(text, index)
+        or is_unspaced(text[index])
+        or (index > 0 and is_unspaced(text[index - 1]))
+    )
+
+
+class Automaton:
+    """Aho-Corasick automaton for finding many trigger words at once.
+
+    A piece of text is scanned in one pass no matter how many
+    words were added. The automaton rebuilds itself lazily
+    the next time it is searched after a word is added or removed.
+    """
+
+    def __init__(self, words=()):
+        self.words = set()
+
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        self._dirty = False
+
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def add(self, word):
+        if word and word not in self.words:
+            self.words.add(word)
+            self._dirty = True
+
+    def remove(self, word):
+        if word in self.words:
+            self.words.discard(word)
+            self._dirty = True
+
+    def build(self):
+        goto = [{}]
+        output = [[]]
+
+        # Build the trie
+        for word in self.words:
+            state = 0
+
+            for char in word:
+                next_state = goto[state].get(char)
+
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append([])
+
+                state = next_state
+
+            output[state].append(word)
+
+        # Breadth-first walk to set the failure links
+        fail = [0] * len(goto)
+        queue = collections.deque(goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+
+                fail[next_state] = goto[fallback].get(char, 0)
+                output[next_state].extend(output[fail[next_state]])
+
+        self._goto = goto
+        self._fail = fail
+        self._output = [tuple(o) for o in output]
+        self._dirty = False
+
+    def ensure_built(self):
+        if self._dirty:
+            self.build()
+
+    def iter_matches(self, text):
+        """Yields (start, end, word) for every occurrence of every word"""
+        self.ensure_built()
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        state = 0
+
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+
+            state = goto[state].get(char, 0)
+
+            for word in output[state]:
+                yield index - len(word) + 1, index + 1, word
+
+    def search(self, text, *, mode=PREFIX):
+        """Yields (start, end, word) for every match that fits the mode"""
+        if mode not in MODES:
+            raise ValueError(f"Unknown match mode '{mode}'")
+
+        for start, end, word in self.iter_matches(text):
+            if mode != SUBSTRING and not is_word_start(text, start):
+                continue
+
+            if mode == WORD and not is_word_end(text, end):
+                continue
+
+            yield start, end, word
@@ -0,0 +1,81 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Counting Bloom filter.
+
+    Every slot is a one byte counter instead of a bit,
+    so keys can be removed as well as added. A counter that
+    reaches 255 stays there, since it can't be trusted anymore.
+    """
+
+    MAX_COUNT = 255
+
+    def __init__(self, capacity=64, error_rate=0.01):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+
+        # Optimal size and number of hashes for the capacity and error rate
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(round(self.size / self.capacity * math.log(2)), 1)
+
+        self.count = 0
+        self._counters = bytearray(self.size)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        counters = self._counters
+        return all(counters[i] for i in self._indexes(key))
+
+    def _indexes(self, key):
+        # Double hashing, so only one digest is needed for every probe
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        counters = self._counters
+
+        for i in self._indexes(key):
+            if counters[i] < self.MAX_COUNT:
+                counters[i] += 1
+
+        self.count += 1
+
+    def remove(self, key):
+        counters = self._counters
+        indexes = self._indexes(key)
+
+        if not all(counters[i] for i in indexes):
+            return
+
+        for i in indexes:
+            if counters[i] < self.MAX_COUNT:
+                counters[i] -= 1
+
+        self.count -= 1
+
+    @property
+    def is_full(self):
+        return self.count >= self.capacity
+
+    @property
+    def false_positive_rate(self):
+        """The estimated false positive rate with the current number of keys"""
+        if not self.count:
+            return 0.0
+
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+    @property
+    def memory_size(self):
+        """The size of the counters in bytes"""
+        return len(self._counters)
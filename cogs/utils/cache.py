@@ -0,0 +1,85 @@
+import collections
+import time
+
+
+class ExpiringCache(collections.OrderedDict):
+    """A dict whose items are dropped a set number of seconds after they're added.
+
+    Items are kept in the order they were added, so expired items are
+    always at the front and can be dropped without looking at the rest.
+    """
+
+    def __init__(self, seconds, *, maxsize=None):
+        super().__init__()
+
+        self.seconds = seconds
+        self.maxsize = maxsize
+
+        # key: time added
+        self._added = {}
+
+    def _verify_cache_integrity(self):
+        cutoff = time.monotonic() - self.seconds
+
+        while self:
+            key = next(iter(self))
+
+            if self._added[key] > cutoff and (self.maxsize is None or len(self) <= self.maxsize):
+                break
+
+            super().__delitem__(key)
+            del self._added[key]
+
+    def __contains__(self, key):
+        self._verify_cache_integrity()
+        return super().__contains__(key)
+
+    def __getitem__(self, key):
+        self._verify_cache_integrity()
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self._verify_cache_integrity()
+        return super().get(key, default)
+
+    def __setitem__(self, key, value):
+        # Setting a key again restarts its timer
+        if super().__contains__(key):
+            super().__delitem__(key)
+
+        super().__setitem__(key, value)
+        self._added[key] = time.monotonic()
+
+        self._verify_cache_integrity()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        del self._added[key]
+
+
+class LRUCache(collections.OrderedDict):
+    """A dict that drops the least recently used item once it's full"""
+
+    def __init__(self, maxsize=128):
+        super().__init__()
+
+        self.maxsize = maxsize
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if not super().__contains__(key):
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self.move_to_end(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
@@ -0,0 +1,84 @@
+# Characters that are invisible and get removed
+INVISIBLE = (
+    "\N{SOFT HYPHEN}",
+    "\N{COMBINING GRAPHEME JOINER}",
+    "\N{ZERO WIDTH SPACE}",
+    "\N{ZERO WIDTH NON-JOINER}",
+    "\N{ZERO WIDTH JOINER}",
+    "\N{LEFT-TO-RIGHT MARK}",
+    "\N{RIGHT-TO-LEFT MARK}",
+    "\N{WORD JOINER}",
+    "\N{INVISIBLE SEPARATOR}",
+    "\N{ZERO WIDTH NO-BREAK SPACE}",
+)
+
+# Letters from other scripts that look like latin letters, in lowercase.
+# Their uppercase forms are added to the table too, so a word folds the same way
+# in either case. Letters that only look latin in one case, like Greek ν and Ν,
+# are left out.
+LOOKALIKES = {
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "ё": "e", "һ": "h", "і": "i", "ї": "i",
+    "ј": "j", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p", "с": "c",
+    "т": "t", "у": "y", "х": "x", "ѕ": "s", "ԁ": "d", "ԛ": "q", "ԝ": "w",
+    "ӏ": "l",
+    # Greek
+    "α": "a", "ε": "e", "ι": "i", "κ": "k", "ο": "o", "ρ": "p", "τ": "t",
+    "χ": "x",
+}
+
+# Apostrophes that should be treated like '
+APOSTROPHES = (
+    "\N{RIGHT SINGLE QUOTATION MARK}",
+    "\N{MODIFIER LETTER APOSTROPHE}",
+)
+
+
+def _build_table():
+    table = {ord(c): None for c in INVISIBLE}
+    table.update({ord(c): "'" for c in APOSTROPHES})
+
+    for c, f in LOOKALIKES.items():
+        table[ord(c)] = f
+        table[ord(c.upper())] = f.upper()
+
+    # Full-width forms of ASCII, like ｄｅｐｌｏｙ
+    for codepoint in range(0xFF01, 0xFF5F):
+        table[codepoint] = chr(codepoint - 0xFEE0)
+
+    return table
+
+
+# Every character maps to at most one other character, so folding only
+# changes the length of a string when something invisible is removed
+CONFUSABLES = _build_table()
+
+REMOVED = frozenset(chr(c) for c, f in CONFUSABLES.items() if f is None)
+
+
+def fold(content):
+    """Folds look-alike characters into the ones they look like in one pass"""
+    return content.translate(CONFUSABLES)
+
+
+if __name__ == "__main__":
+    # Benchmark: python -m cogs.utils.confusables
+    import timeit
+
+    samples = {
+        "plain": "hey can someone deploy the new build to staging when they get a chance? " * 4,
+        "confusables": "hey саn sоmеоnе dерlоу the new build to ｓｔａｇｉｎｇ when they get a chance? " * 4,
+        "zero width": "hey can some\u200bone de\u200bploy the new build to stag\u200cing when they get a chance? " * 4,
+    }
+
+    number = 100_000
+
+    for name, sample in samples.items():
+        baseline = timeit.timeit(lambda: sample.lower(), number=number) / number
+        folded = timeit.timeit(lambda: fold(sample), number=number) / number
+
+        print(
+            f"{name:>12} ({len(sample)} chars): "
+            f"fold {folded * 1e6:.2f}µs per message, "
+            f"lower() {baseline * 1e6:.2f}µs per message"
+        )
@@ -0,0 +1,200 @@
+import asyncio
+import collections
+import logging
+import time
+
+import discord
+
+from .cache import LRUCache
+
+
+log = logging.getLogger("glados.delivery")
+
+
+# How soon a DM should go out
+HIGH = "high"
+NORMAL = "normal"
+LOW = "low"
+
+# Everything queued at a priority is sent before anything after it
+PRIORITIES = (HIGH, NORMAL, LOW)
+
+
+class TokenBucket:
+    """Allows rate sends per second on average, with bursts of up to capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        self._refill()
+
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+
+        self.tokens -= 1
+
+
+class Delivery:
+    __slots__ = ("user", "content", "embed", "future", "queued")
+
+    def __init__(self, user, content, embed, future):
+        self.user = user
+        self.content = content
+        self.embed = embed
+        self.future = future
+        self.queued = time.perf_counter()
+
+
+class DeliveryScheduler:
+    """Sends DMs through one rate limited worker.
+
+    Each user has their own queue for each priority. The worker always
+    takes from the highest priority with anything queued, and goes round
+    robin between users there, so one user with a burst of notifications
+    can't hold up everyone else.
+    """
+
+    def __init__(self, loop, *, rate=5.0, burst=10, dm_cache_size=1024):
+        self.loop = loop
+        self.bucket = TokenBucket(rate, burst)
+
+        # user_id: DMChannel
+        self.dm_channels = LRUCache(dm_cache_size)
+
+        # (priority, user_id): deque of Delivery
+        self._queues = {}
+
+        # priority: deque of user_ids with something queued, in turn order
+        self._turns = {priority: collections.deque() for priority in PRIORITIES}
+
+        self._worker = None
+
+        self.sent = 0
+        self.failed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def depth(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def depth_by_priority(self):
+        depths = dict.fromkeys(PRIORITIES, 0)
+
+        for (priority, user_id), queue in self._queues.items():
+            depths[priority] += len(queue)
+
+        return depths
+
+    @property
+    def average_latency(self):
+        done = self.sent + self.failed
+        return self.total_latency / done if done else 0.0
+
+    def send(self, user, content=None, *, embed=None, priority=NORMAL):
+        """Queues a DM to the user.
+
+        Returns a future that's done once it's been sent, and has the
+        exception if it couldn't be.
+        """
+        if priority not in self._turns:
+            raise ValueError(f"Unknown priority '{priority}'")
+
+        future = self.loop.create_future()
+        key = (priority, user.id)
+
+        queue = self._queues.get(key)
+
+        if queue is None:
+            queue = self._queues[key] = collections.deque()
+            self._turns[priority].append(user.id)
+
+        queue.append(Delivery(user, content, embed, future))
+
+        if self._worker is None or self._worker.done():
+            self._worker = self.loop.create_task(self._run())
+
+        return future
+
+    def _next(self):
+        for priority in PRIORITIES:
+            turns = self._turns[priority]
+
+            if not turns:
+                continue
+
+            user_id = turns.popleft()
+            key = (priority, user_id)
+            queue = self._queues[key]
+
+            delivery = queue.popleft()
+
+            # Go to the back of the line if there's more for this user
+            if queue:
+                turns.append(user_id)
+
+            else:
+                del self._queues[key]
+
+            return delivery
+
+        return None
+
+    async def get_dm_channel(self, user):
+        channel = self.dm_channels.get(user.id)
+
+        if channel is None:
+            channel = user.dm_channel or await user.create_dm()
+            self.dm_channels[user.id] = channel
+
+        return channel
+
+    async def _run(self):
+        while True:
+            delivery = self._next()
+
+            if delivery is None:
+                return
+
+            if delivery.future.cancelled():
+                continue
+
+            await self.bucket.acquire()
+
+            try:
+                channel = await self.get_dm_channel(delivery.user)
+                await channel.send(delivery.content, embed=delivery.embed)
+
+            except Exception as e:
+                self.failed += 1
+
+                if isinstance(e, discord.HTTPException):
+                    log.info(f"Could not send a DM to user {delivery.user}: {e}")
+
+                else:
+                    log.exception(f"Sending a DM to user {delivery.user} failed")
+
+                if not delivery.future.done():
+                    delivery.future.set_exception(e)
+
+            else:
+                self.sent += 1
+
+                if not delivery.future.done():
+                    delivery.future.set_result(None)
+
+            finally:
+                latency = time.perf_counter() - delivery.queued
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
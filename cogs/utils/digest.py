@@ -0,0 +1,111 @@
+class Highlight:
+    """A trigger word found in a message, with the messages around it"""
+
+    __slots__ = ("message", "word", "normalized", "spans", "before", "after")
+
+    def __init__(self, message, word, *, normalized=None, spans=None, before=(), after=()):
+        self.message = message
+        self.word = word
+        self.normalized = normalized
+        self.spans = spans
+        self.before = list(before)
+        self.after = list(after)
+
+    @property
+    def context(self):
+        return self.before + [self.message] + self.after
+
+
+def merge_context(highlights):
+    """Groups highlights by channel and merges the context they share.
+
+    Returns a list of (channel, highlights, runs), in the order each channel
+    first came up. Each run is a list of messages oldest first, and runs
+    only get split where the context of two highlights doesn't touch.
+    """
+    channels = {}
+
+    for highlight in highlights:
+        channels.setdefault(highlight.message.channel.id, []).append(highlight)
+
+    merged = []
+
+    for channel_highlights in channels.values():
+        channel_highlights.sort(key=lambda h: h.message.id)
+
+        runs = []
+        seen = set()
+
+        for highlight in channel_highlights:
+            context = sorted(highlight.context, key=lambda m: m.id)
+
+            # Context that starts inside the last run continues it
+            if not runs or context[0].id > runs[-1][-1].id:
+                runs.append([])
+
+            for message in context:
+                if message.id not in seen:
+                    seen.add(message.id)
+                    runs[-1].append(message)
+
+            runs[-1].sort(key=lambda m: m.id)
+
+        merged.append((channel_highlights[0].message.channel, channel_highlights, runs))
+
+    return merged
+
+
+class DigestBuffer:
+    """Holds each user's highlights for a while, then sends them together.
+
+    The first highlight for a user starts their window. Everything that
+    comes in before it ends is sent in the same digest.
+    """
+
+    def __init__(self, loop, window, send):
+        self.loop = loop
+        self.window = window
+
+        # Coroutine function that takes the user and their highlights
+        self.send = send
+
+        # user_id: (user, list of Highlight)
+        self._pending = {}
+
+        # user_id: TimerHandle
+        self._timers = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, user, highlight):
+        pending = self._pending.get(user.id)
+
+        if pending is None:
+            pending = self._pending[user.id] = (user, [])
+            self._timers[user.id] = self.loop.call_later(
+                self.window, self._flush_later, user.id
+            )
+
+        pending[1].append(highlight)
+
+    def _flush_later(self, user_id):
+        self.loop.create_task(self.flush(user_id))
+
+    async def flush(self, user_id):
+        timer = self._timers.pop(user_id, None)
+
+        if timer:
+            timer.cancel()
+
+        pending = self._pending.pop(user_id, None)
+
+        if not pending:
+            return
+
+        user, highlights = pending
+        await self.send(user, highlights)
+
+    def flush_all(self):
+        for user_id in list(self._pending):
+            self._flush_later(user_id)
@@ -0,0 +1,159 @@
+import itertools
+
+
+# Fuzzy triggers start with this, like ~deploy
+FUZZY_MARKER = "~"
+
+# Fuzzy triggers have to be at least this long,
+# since anything shorter is a typo away from too many words
+MIN_FUZZY_LENGTH = 4
+
+# The most typos any fuzzy trigger allows
+MAX_DISTANCE = 2
+
+
+def is_fuzzy(trigger):
+    return trigger.startswith(FUZZY_MARKER)
+
+
+def max_distance(word):
+    """How many typos a word can have and still match"""
+    return 1 if len(word) <= 5 else MAX_DISTANCE
+
+
+def edit_distance(first, second, limit):
+    """Optimal string alignment distance, which counts swapped letters as one typo.
+
+    Returns limit + 1 as soon as the distance is known to be over the limit.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+
+    previous_previous = None
+    previous = list(range(len(second) + 1))
+
+    for i, first_char in enumerate(first, start=1):
+        current = [i] + [0] * len(second)
+
+        for j, second_char in enumerate(second, start=1):
+            cost = first_char != second_char
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + cost,
+            )
+
+            if (
+                previous_previous is not None
+                and j > 1
+                and first_char == second[j - 2]
+                and first[i - 2] == second_char
+            ):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+
+        if min(current) > limit:
+            return limit + 1
+
+        previous_previous, previous = previous, current
+
+    return previous[-1]
+
+
+def deletes(word, distance):
+    """Returns every string made by deleting up to distance characters from the word"""
+    results = {word}
+
+    for count in range(1, min(distance, len(word)) + 1):
+        for positions in itertools.combinations(range(len(word)), count):
+            results.add("".join(c for i, c in enumerate(word) if i not in positions))
+
+    return results
+
+
+class FuzzyIndex:
+    """SymSpell style deletion index for typo tolerant lookups.
+
+    Every word is stored under all the strings made by deleting
+    some of its characters. Looking up a token only has to generate
+    the token's own deletes and check the few words stored under them,
+    so lookups don't get slower as more words are added.
+    """
+
+    def __init__(self):
+        self.words = set()
+
+        # delete: {word, ...}
+        self._deletes = {}
+
+        self.min_length = 0
+        self.max_length = 0
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def _update_lengths(self):
+        lengths = [len(w) for w in self.words]
+        self.min_length = min(lengths, default=0)
+        self.max_length = max(lengths, default=0)
+
+    def _deletes_for(self, word):
+        return deletes(word, max_distance(word))
+
+    def add(self, word):
+        if word in self.words:
+            return
+
+        self.words.add(word)
+
+        for delete in self._deletes_for(word):
+            self._deletes.setdefault(delete, set()).add(word)
+
+        if len(self.words) == 1:
+            self.min_length = self.max_length = len(word)
+
+        else:
+            self.min_length = min(self.min_length, len(word))
+            self.max_length = max(self.max_length, len(word))
+
+    def remove(self, word):
+        if word not in self.words:
+            return
+
+        self.words.discard(word)
+
+        for delete in self._deletes_for(word):
+            words = self._deletes.get(delete)
+
+            if words is None:
+                continue
+
+            words.discard(word)
+
+            if not words:
+                del self._deletes[delete]
+
+        if len(word) in (self.min_length, self.max_length):
+            self._update_lengths()
+
+    def lookup(self, token):
+        """Returns every word the token is a typo (or an exact match) of"""
+        if not self.words:
+            return set()
+
+        # A token that's too short or too long can't be a few typos away from any word
+        if not self.min_length - MAX_DISTANCE <= len(token) <= self.max_length + MAX_DISTANCE:
+            return set()
+
+        candidates = set()
+
+        for delete in deletes(token, MAX_DISTANCE):
+            candidates.update(self._deletes.get(delete, ()))
+
+        return {
+            word
+            for word in candidates
+            if edit_distance(token, word, max_distance(word)) <= max_distance(word)
+        }
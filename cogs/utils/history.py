@@ -0,0 +1,172 @@
+import collections
+import itertools
+
+
+class PendingContext:
+    """A notification waiting for the messages sent after its message"""
+
+    __slots__ = ("message", "limit", "messages", "future", "handle")
+
+    def __init__(self, message, limit, messages, future):
+        self.message = message
+        self.limit = limit
+        self.messages = messages
+        self.future = future
+        self.handle = None
+
+    def wants(self, message):
+        return (
+            message.id != self.message.id
+            and message.created_at > self.message.created_at
+        )
+
+
+class ChannelHistory:
+    """The last few messages sent in every channel, for notification context.
+
+    Each channel keeps a ring buffer of its most recent messages, so finding
+    the messages around one only looks at that channel's buffer,
+    no matter how many messages are cached everywhere else.
+    Only the most recently active channels are kept, so the total
+    number of messages held is bounded too.
+
+    Notifications that still need messages after theirs wait here too.
+    New messages fill every notification waiting on their channel,
+    instead of each notification adding its own wait_for check.
+    """
+
+    def __init__(self, loop, depth=20, max_channels=100):
+        self.loop = loop
+        self.depth = depth
+        self.max_channels = max_channels
+
+        # channel_id: deque of messages, oldest first
+        # The least recently active channel is first
+        self._channels = collections.OrderedDict()
+
+        # channel_id: list of PendingContext
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._channels)
+
+    def add(self, message):
+        messages = self._channels.get(message.channel.id)
+
+        if messages is None:
+            messages = self._channels[message.channel.id] = collections.deque(
+                maxlen=self.depth
+            )
+
+            if len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+
+        else:
+            self._channels.move_to_end(message.channel.id)
+
+        messages.append(message)
+
+        pending = self._pending.get(message.channel.id)
+
+        if pending:
+            for waiting in pending[:]:
+                if not waiting.wants(message):
+                    continue
+
+                waiting.messages.append(message)
+
+                if len(waiting.messages) >= waiting.limit:
+                    self._release(waiting)
+
+    def get(self, channel_id, message_id):
+        for message in self._channels.get(channel_id, ()):
+            if message.id == message_id:
+                return message
+
+        return None
+
+    def remove(self, channel_id, message_id):
+        messages = self._channels.get(channel_id)
+
+        if not messages:
+            return
+
+        for message in messages:
+            if message.id == message_id:
+                messages.remove(message)
+                return
+
+    def clear(self, channel_id):
+        self._channels.pop(channel_id, None)
+
+    def clear_guild(self, guild):
+        for channel in guild.channels:
+            self._channels.pop(channel.id, None)
+
+    def before(self, message, limit):
+        """Returns up to limit messages sent right before the message, oldest first"""
+        messages = self._channels.get(message.channel.id, ())
+
+        # Messages that came in after this one are skipped
+        earlier = (
+            m
+            for m in reversed(messages)
+            if m.created_at <= message.created_at and m.id != message.id
+        )
+
+        return list(itertools.islice(earlier, limit))[::-1]
+
+    def after(self, message, limit):
+        """Returns up to limit messages sent right after the message, oldest first"""
+        messages = self._channels.get(message.channel.id, ())
+
+        later = []
+
+        # Walk back from the newest message until this one is reached
+        for m in reversed(messages):
+            if m.created_at < message.created_at or m.id == message.id:
+                break
+
+            later.append(m)
+
+        return later[::-1][:limit]
+
+    async def wait_after(self, message, limit, timeout):
+        """Returns up to limit messages sent right after the message, oldest first.
+
+        If fewer than limit have been sent, waits up to timeout seconds for the rest.
+        """
+        later = self.after(message, limit)
+
+        if len(later) >= limit:
+            return later
+
+        waiting = PendingContext(message, limit, later, self.loop.create_future())
+        waiting.handle = self.loop.call_later(timeout, self._release, waiting)
+
+        self._pending.setdefault(message.channel.id, []).append(waiting)
+
+        try:
+            return await waiting.future
+
+        finally:
+            self._release(waiting)
+
+    def _release(self, waiting):
+        waiting.handle.cancel()
+
+        if not waiting.future.done():
+            waiting.future.set_result(waiting.messages)
+
+        channel_id = waiting.message.channel.id
+        pending = self._pending.get(channel_id)
+
+        if pending and waiting in pending:
+            pending.remove(waiting)
+
+            if not pending:
+                del self._pending[channel_id]
+
+    @property
+    def pending_count(self):
+        return sum(len(p) for p in self._pending.values())
@@ -0,0 +1,208 @@
+import bisect
+import collections
+import difflib
+import re
+import unicodedata
+
+from .confusables import REMOVED, fold
+
+
+# Mentions and custom emojis are markup, not words
+MARKUP = r"<a?:\w+:\d+>|<(?:@[!&]?|#)\d+>"
+
+
+def _combining_marks():
+    # \w doesn't match combining marks, but Thai, Hindi, and
+    # decomposed accents need them to stay in the same word
+    ranges = []
+
+    for codepoint in range(0x300, 0x10000):
+        if not unicodedata.category(chr(codepoint)).startswith("M"):
+            continue
+
+        if ranges and ranges[-1][1] == codepoint - 1:
+            ranges[-1][1] = codepoint
+
+        else:
+            ranges.append([codepoint, codepoint])
+
+    return "".join(f"{chr(start)}-{chr(end)}" for start, end in ranges)
+
+
+MARKS = _combining_marks()
+
+# Letters and numbers (with any marks on them), with apostrophes allowed inside words.
+# Underscores count as markdown, not as part of a word.
+LETTERS = rf"[^\W_]+(?:[{MARKS}]+[^\W_]*)*"
+WORD = rf"{LETTERS}(?:'{LETTERS})*"
+
+TOKEN_RE = re.compile(rf"({MARKUP})|({WORD})")
+WORD_RE = re.compile(WORD)
+
+# Scripts that are written without spaces between words, like Chinese and Japanese.
+# A message in these is one long token, so their words have to be found inside tokens.
+UNSPACED = (
+    "\u0e00-\u0eff"  # Thai and Lao
+    "\u1000-\u109f"  # Myanmar
+    "\u1780-\u17ff"  # Khmer
+    "\u3005-\u3007"  # Ideographic iteration marks
+    "\u3040-\u30ff"  # Hiragana and Katakana
+    "\u31f0-\u31ff"  # Katakana extensions
+    "\u3400-\u4dbf"  # CJK extension A
+    "\u4e00-\u9fff"  # CJK unified ideographs
+    "\uf900-\ufaff"  # CJK compatibility ideographs
+    "\U00020000-\U0003134f"  # CJK extensions B and later
+)
+
+UNSPACED_RE = re.compile(f"[{UNSPACED}]")
+
+
+def is_unspaced(char):
+    """Returns whether a character is from a script written without spaces"""
+    return UNSPACED_RE.match(char) is not None
+
+
+Token = collections.namedtuple("Token", "text start end")
+
+
+def _normalize_folded(word):
+    word = unicodedata.normalize("NFKC", word).casefold()
+
+    # NFKC can turn one character into several (like ½ into 1⁄2),
+    # so only keep the word characters
+    return "".join(WORD_RE.findall(word))
+
+
+def tokenize(content):
+    """Splits content into normalized tokens with their offsets in the content"""
+    tokens = []
+
+    # Look-alike characters are folded before splitting,
+    # so invisible characters can't split a word in two
+    folded = fold(content)
+
+    if len(folded) == len(content):
+        offsets = None
+
+    else:
+        # Invisible characters were removed, so keep track
+        # of where every character came from
+        offsets = [i for i, c in enumerate(content) if c not in REMOVED]
+
+    for match in TOKEN_RE.finditer(folded):
+        if match.group(1):
+            continue
+
+        text = _normalize_folded(match.group(2))
+
+        if not text:
+            continue
+
+        if offsets is None:
+            tokens.append(Token(text, match.start(), match.end()))
+
+        else:
+            tokens.append(Token(text, offsets[match.start()], offsets[match.end() - 1] + 1))
+
+    return tokens
+
+
+def normalize_phrase(content):
+    """Normalizes a word or phrase into its words joined with single spaces"""
+    return " ".join(t.text for t in tokenize(content))
+
+
+def changed_ranges(old, new, *, context=0):
+    """Diffs two :class:`NormalizedContent` by token.
+
+    Returns (first, last) ranges of tokens in new that were added or changed,
+    widened by context tokens on each side and merged where they overlap.
+    Removed tokens count as a change where the tokens around them now meet,
+    since that can bring a phrase together.
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [t.text for t in old.tokens], [t.text for t in new.tokens], autojunk=False
+    )
+
+    ranges = []
+
+    for tag, _, _, first, last in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+
+        first = max(first - context, 0)
+        last = min(last + context, len(new.tokens))
+
+        # Without any context, a removal leaves nothing to rescan
+        if first >= last:
+            continue
+
+        if ranges and first <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(last, ranges[-1][1]))
+
+        else:
+            ranges.append((first, last))
+
+    return ranges
+
+
+class NormalizedContent:
+    """A message's content, normalized once for everything that needs it.
+
+    Look-alike characters are folded, and the content is casefolded,
+    NFKC normalized, and stripped of punctuation and markdown. :attr:`text` is the normalized
+    words joined with single spaces, which is what the matcher
+    searches. Offsets in :attr:`text` can be mapped back to the
+    original content with :meth:`original_span`.
+    """
+
+    __slots__ = ("content", "tokens", "text", "_starts")
+
+    def __init__(self, content):
+        self.content = content
+        self.tokens = tokenize(content)
+
+        self._starts = []
+        position = 0
+
+        for token in self.tokens:
+            self._starts.append(position)
+            position += len(token.text) + 1
+
+        self.text = " ".join(t.text for t in self.tokens)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __bool__(self):
+        return bool(self.tokens)
+
+    def window(self, first, last):
+        """Returns (offset, text) for the tokens from first up to last in :attr:`text`"""
+        start = self._starts[first]
+        end = self._starts[last - 1] + len(self.tokens[last - 1].text)
+
+        return start, self.text[start:end]
+
+    def original_span(self, start, end):
+        """Maps a (start, end) span in :attr:`text` to a span in the original content"""
+        first = bisect.bisect_right(self._starts, start) - 1
+        last = bisect.bisect_right(self._starts, end - 1) - 1
+
+        first_token = self.tokens[first]
+        last_token = self.tokens[last]
+
+        # Normalization can change a token's length, and then
+        # the offsets inside it don't line up anymore.
+        # If that happens, use the whole token.
+        if len(first_token.text) == first_token.end - first_token.start:
+            original_start = first_token.start + start - self._starts[first]
+        else:
+            original_start = first_token.start
+
+        if len(last_token.text) == last_token.end - last_token.start:
+            original_end = last_token.start + end - self._starts[last]
+        else:
+            original_end = last_token.end
+
+        return original_start, original_end
@@ -0,0 +1,100 @@
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+import pickle
+
+
+log = logging.getLogger("glados.offload")
+
+
+# guild_id: (version, GuildTriggers)
+# This only exists in the worker processes
+_worker_guilds = {}
+
+
+def _search_in_worker(guild_id, version, payload, text, mode, budget):
+    """Runs a search in a worker process.
+
+    Returns None if the worker doesn't have this version of the guild's
+    triggers and no payload was sent, so the caller knows to send it.
+    """
+    cached = _worker_guilds.get(guild_id)
+
+    if cached is None or cached[0] != version:
+        if payload is None:
+            return None
+
+        cached = _worker_guilds[guild_id] = (version, pickle.loads(payload))
+
+    guild_triggers = cached[1]
+    return list(guild_triggers.search(text, mode=mode, budget=budget))
+
+
+class MatchOffloader:
+    """Runs expensive searches in a process pool so they don't block the event loop.
+
+    Each worker keeps the compiled triggers for the guilds it has seen,
+    so most searches only send the message text over and get
+    match offsets back. The triggers are only pickled and sent
+    again after they change.
+    """
+
+    def __init__(self, *, workers, min_length, min_triggers):
+        self.workers = workers
+        self.min_length = min_length
+        self.min_triggers = min_triggers
+
+        # Spawn instead of fork, so the workers don't inherit the bot's event loop
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+        # guild_id: (version, pickled GuildTriggers)
+        self._payloads = {}
+
+        self.offloaded = 0
+
+    def should_offload(self, guild_triggers, text):
+        return len(text) >= self.min_length and len(guild_triggers) >= self.min_triggers
+
+    def _payload(self, guild_triggers):
+        cached = self._payloads.get(guild_triggers.guild_id)
+
+        if cached is not None and cached[0] == guild_triggers.version:
+            return cached[1]
+
+        # Build the automaton first, so the workers don't all have to
+        guild_triggers.automaton.ensure_built()
+        payload = pickle.dumps(guild_triggers, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self._payloads[guild_triggers.guild_id] = (guild_triggers.version, payload)
+        return payload
+
+    async def search(self, guild_triggers, text, *, mode, budget=None):
+        """Same as :meth:`GuildTriggers.search`, but in a worker process.
+
+        Returns a list of (start, end, trigger).
+        """
+        loop = asyncio.get_event_loop()
+        guild_id = guild_triggers.guild_id
+        version = guild_triggers.version
+
+        self.offloaded += 1
+
+        result = await loop.run_in_executor(
+            self.executor, _search_in_worker, guild_id, version, None, text, mode, budget
+        )
+
+        if result is None:
+            log.info(f"Sending triggers for guild {guild_id} (version {version}) to a worker")
+            payload = self._payload(guild_triggers)
+
+            result = await loop.run_in_executor(
+                self.executor, _search_in_worker, guild_id, version, payload, text, mode, budget
+            )
+
+        return result
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,158 @@
+import functools
+import re
+import time
+
+from .automaton import is_word_end
+from .normalize import tokenize
+
+
+# Restricted wildcard syntax for triggers
+# * matches any number of characters inside a word
+# ? matches exactly one character inside a word
+# Everything else is matched literally
+STAR = "*"
+ANY = "?"
+WILDCARDS = (STAR, ANY)
+
+WILDCARD_RE = re.compile(r"([*?])")
+
+# How many characters to scan between deadline checks
+DEADLINE_INTERVAL = 64
+
+
+def is_pattern(trigger):
+    return STAR in trigger or ANY in trigger
+
+
+def normalize_pattern(content):
+    """Normalizes a trigger while keeping its wildcards.
+
+    Every literal part is normalized the same way as message content.
+    """
+    parts = []
+
+    for part in WILDCARD_RE.split(content):
+        if part in WILDCARDS:
+            parts.append(part)
+            continue
+
+        tokens = tokenize(part)
+
+        if not tokens:
+            # Only punctuation or spaces, which separate words
+            if part:
+                parts.append(" ")
+
+            continue
+
+        words = " ".join(t.text for t in tokens)
+
+        # Keep whatever separated this part from the wildcards next to it
+        if tokens[0].start > 0:
+            words = " " + words
+
+        if tokens[-1].end < len(part):
+            words += " "
+
+        parts.append(words)
+
+    return " ".join("".join(parts).split())
+
+
+def literal_prefix(pattern):
+    """Returns the literal text before the first wildcard"""
+    return WILDCARD_RE.split(pattern, 1)[0]
+
+
+class Pattern:
+    """A wildcard trigger compiled to a non-deterministic automaton.
+
+    Matching simulates every state at once instead of backtracking,
+    so it takes time linear in the text for every pattern.
+    """
+
+    __slots__ = ("pattern", "_elements", "_accept")
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self._elements = tuple(pattern)
+        self._accept = len(self._elements)
+
+    def __repr__(self):
+        return f"<Pattern pattern={self.pattern!r}>"
+
+    def _closure(self, states):
+        # A star can match nothing, so it can be skipped over
+        elements = self._elements
+        closed = set()
+        stack = list(states)
+
+        while stack:
+            state = stack.pop()
+
+            if state in closed:
+                continue
+
+            closed.add(state)
+
+            if state < self._accept and elements[state] == STAR:
+                stack.append(state + 1)
+
+        return closed
+
+    def match(self, text, start, *, whole_word=False, deadline=None):
+        """Matches the pattern against the text starting at start.
+
+        Returns the end of the longest match, or None if it doesn't match
+        or the deadline (from :func:`time.perf_counter`) passed.
+        If whole_word is True, the match has to end at the end of a word.
+        """
+        elements = self._elements
+        accept = self._accept
+
+        states = self._closure({0})
+        longest = None
+
+        for index in range(start, len(text) + 1):
+            if accept in states and (not whole_word or is_word_end(text, index)):
+                longest = index
+
+            if index == len(text):
+                break
+
+            if deadline and (index - start) % DEADLINE_INTERVAL == 0:
+                if time.perf_counter() > deadline:
+                    return None
+
+            char = text[index]
+            next_states = set()
+
+            for state in states:
+                if state == accept:
+                    continue
+
+                element = elements[state]
+
+                # Wildcards never match across words
+                if element == STAR:
+                    if char != " ":
+                        next_states.add(state)
+
+                elif element == ANY:
+                    if char != " ":
+                        next_states.add(state + 1)
+
+                elif element == char:
+                    next_states.add(state + 1)
+
+            if not next_states:
+                break
+
+            states = self._closure(next_states)
+
+        return longest
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_pattern(pattern):
+    return Pattern(pattern)
@@ -0,0 +1,89 @@
+import collections
+import logging
+import time
+
+
+log = logging.getLogger("glados.router")
+
+
+# What kind of message something is, decided once per message
+BOT = "bot"
+WEBHOOK = "webhook"
+MENTION = "mention"
+COMMAND = "command"
+DM = "dm"
+SCAN = "scan"
+
+KINDS = (BOT, WEBHOOK, MENTION, COMMAND, DM, SCAN)
+
+
+class HandlerStats:
+    __slots__ = ("calls", "errors", "total", "max")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    @property
+    def average(self):
+        return self.total / self.calls if self.calls else 0.0
+
+
+class MessageRouter:
+    """Sends each message to only the handlers registered for its kind.
+
+    Handlers are coroutines that take the message, or its context for
+    commands. They run as their own tasks, like event listeners,
+    and every run is timed.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+
+        # kind: {name: handler}
+        self.handlers = {kind: {} for kind in KINDS}
+
+        # (kind, name): HandlerStats
+        self.stats = {}
+
+        # kind: how many messages were routed as it
+        self.routed = collections.Counter()
+
+    def add_handler(self, kind, name, handler):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown message kind '{kind}'")
+
+        self.handlers[kind][name] = handler
+        self.stats.setdefault((kind, name), HandlerStats())
+
+    def remove_handler(self, kind, name):
+        self.handlers[kind].pop(name, None)
+
+    def dispatch(self, kind, message):
+        self.routed[kind] += 1
+
+        for name, handler in self.handlers[kind].items():
+            self.loop.create_task(self._run(kind, name, handler, message))
+
+    async def _run(self, kind, name, handler, message):
+        stats = self.stats[(kind, name)]
+        start = time.perf_counter()
+
+        try:
+            await handler(message)
+
+        except Exception:
+            stats.errors += 1
+            # Commands are dispatched with their context
+            message = getattr(message, "message", message)
+            log.exception(f"Handler {name} failed on message {message.id}")
+
+        finally:
+            stats.record(time.perf_counter() - start)
@@ -0,0 +1,184 @@
+import logging
+import mmap
+import os
+import struct
+
+
+log = logging.getLogger("glados.snapshot")
+
+
+# File layout (everything little-endian):
+#
+# header     magic, format version, watermark, row count, guild count
+# directory  guild id, section offset, section length, row count, word count
+#            (one entry per guild)
+# sections   rows of user id, word length, scope length, UTF-8 word,
+#            scope channel ids (one section per guild)
+#
+# The watermark is the highest trigger_words id in the snapshot.
+# Rows are only ever added with higher ids, so if the database still
+# has as many rows at or below the watermark, nothing was deleted
+# and only the rows above it need to be loaded.
+
+MAGIC = b"GLTS"
+
+# Version 3 only holds normalized trigger words, so older snapshots
+# are reloaded from the database, which normalizes them
+FORMAT_VERSION = 3
+
+HEADER = struct.Struct("<4sHxxQQI")
+ENTRY = struct.Struct("<QQQII")
+ROW = struct.Struct("<QHH")
+CHANNEL = struct.Struct("<Q")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def encode_rows(words, scopes):
+    """Encodes a guild's {word: {user_id, ...}} and {(word, user_id): scope} into a section"""
+    data = bytearray()
+
+    for word, users in words.items():
+        encoded = word.encode("utf-8")
+
+        for user_id in users:
+            scope = scopes.get((word, user_id), ())
+
+            data += ROW.pack(user_id, len(encoded), len(scope))
+            data += encoded
+
+            for channel_id in scope:
+                data += CHANNEL.pack(channel_id)
+
+    return bytes(data)
+
+
+class Snapshot:
+    """A memory-mapped trigger snapshot.
+
+    Only the header and directory are read when it's opened.
+    A guild's rows are decoded from the mapped file the first time
+    they are asked for, so the bot can start matching right away.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self._file = open(path, "rb")
+
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        except ValueError:
+            # Empty file
+            self._file.close()
+            raise SnapshotError("Snapshot is empty")
+
+        try:
+            self._read_directory()
+
+        except struct.error:
+            self.close()
+            raise SnapshotError("Snapshot is truncated")
+
+        except SnapshotError:
+            self.close()
+            raise
+
+    def _read_directory(self):
+        magic, version, self.watermark, self.rows, guild_count = HEADER.unpack_from(
+            self._map, 0
+        )
+
+        if magic != MAGIC:
+            raise SnapshotError("Not a trigger snapshot")
+
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot version {version}")
+
+        # guild_id: (offset, length, rows, words)
+        self.guilds = {}
+
+        position = HEADER.size
+
+        for _ in range(guild_count):
+            guild_id, *entry = ENTRY.unpack_from(self._map, position)
+            self.guilds[guild_id] = tuple(entry)
+            position += ENTRY.size
+
+    def __contains__(self, guild_id):
+        return guild_id in self.guilds
+
+    def row_count(self, guild_id):
+        return self.guilds[guild_id][2]
+
+    def word_count(self, guild_id):
+        return self.guilds[guild_id][3]
+
+    def section(self, guild_id):
+        offset, length, rows, words = self.guilds[guild_id]
+        return self._map[offset : offset + length]
+
+    def iter_rows(self, guild_id):
+        """Yields (word, user_id, scope) for every row in a guild.
+
+        scope is a list of channel and category ids, or None.
+        """
+        offset, length, rows, words = self.guilds[guild_id]
+
+        position = offset
+
+        for _ in range(rows):
+            user_id, word_length, scope_length = ROW.unpack_from(self._map, position)
+            position += ROW.size
+
+            word = str(self._map[position : position + word_length], "utf-8")
+            position += word_length
+
+            scope = None
+
+            if scope_length:
+                scope = [
+                    CHANNEL.unpack_from(self._map, position + i * CHANNEL.size)[0]
+                    for i in range(scope_length)
+                ]
+                position += scope_length * CHANNEL.size
+
+            yield word, user_id, scope
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def write_snapshot(path, sections, *, watermark):
+    """Writes a snapshot from (guild_id, rows, words, section) tuples.
+
+    The file is written next to the old one and then swapped in,
+    so a snapshot that is still mapped stays readable.
+    """
+    sections = sorted(sections)
+
+    position = HEADER.size + ENTRY.size * len(sections)
+    directory = bytearray()
+
+    for guild_id, rows, words, section in sections:
+        directory += ENTRY.pack(guild_id, position, len(section), rows, words)
+        position += len(section)
+
+    total_rows = sum(rows for _, rows, _, _ in sections)
+
+    temp_path = f"{path}.tmp"
+
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, watermark, total_rows, len(sections)))
+        f.write(directory)
+
+        for _, _, _, section in sections:
+            f.write(section)
+
+    os.replace(temp_path, path)
+
+    log.info(f"Wrote snapshot of {total_rows} triggers at watermark {watermark} to {path}")
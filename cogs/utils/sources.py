@@ -0,0 +1,89 @@
+import discord
+
+
+# Message content is always scanned. These can be turned on and off per guild.
+EMBEDS = "embeds"
+ATTACHMENTS = "attachments"
+WEBHOOKS = "webhooks"
+
+SOURCES = (EMBEDS, ATTACHMENTS, WEBHOOKS)
+DEFAULT_SOURCES = frozenset((EMBEDS, ATTACHMENTS))
+
+
+def _text(value):
+    return value if isinstance(value, str) else ""
+
+
+def embed_text(embeds):
+    """Joins the titles, descriptions, and fields of embeds into one string"""
+    lines = []
+
+    for embed in embeds:
+        if isinstance(embed, dict):
+            embed = discord.Embed.from_dict(embed)
+
+        lines.append(_text(embed.title))
+        lines.append(_text(embed.description))
+
+        for field in embed.fields:
+            lines.append(_text(field.name))
+            lines.append(_text(field.value))
+
+    return "\n".join(line for line in lines if line)
+
+
+def attachment_text(attachments):
+    """Joins the filenames of attachments into one string"""
+    return "\n".join(
+        a["filename"] if isinstance(a, dict) else a.filename for a in attachments
+    )
+
+
+class MessageText:
+    """The text of a message that can be scanned, split up by where it came from"""
+
+    __slots__ = ("content", "embeds", "attachments")
+
+    def __init__(self, content, embeds="", attachments=""):
+        self.content = content
+        self.embeds = embeds
+        self.attachments = attachments
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(
+            message.content,
+            embed_text(message.embeds),
+            attachment_text(message.attachments),
+        )
+
+    def edited(self, data):
+        """Returns the text after an edit, from a raw message update"""
+        return MessageText(
+            data.get("content", self.content),
+            embed_text(data["embeds"]) if "embeds" in data else self.embeds,
+            attachment_text(data["attachments"]) if "attachments" in data else self.attachments,
+        )
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, MessageText)
+            and self.content == other.content
+            and self.embeds == other.embeds
+            and self.attachments == other.attachments
+        )
+
+    def scan_text(self, sources):
+        """Joins the text from every enabled source, starting with the content.
+
+        The content always comes first, so offsets in it stay the same.
+        """
+        parts = [self.content]
+
+        if EMBEDS in sources and self.embeds:
+            parts.append(self.embeds)
+
+        if ATTACHMENTS in sources and self.attachments:
+            parts.append(self.attachments)
+
+        return "\n".join(parts)
@@ -0,0 +1,103 @@
+import functools
+
+
+# Stem triggers start with this, like +mouse
+STEM_MARKER = "+"
+
+VOWELS = frozenset("aeiouy")
+
+# Words that don't follow the suffix rules, mapped to their base form
+IRREGULARS = {
+    "children": "child",
+    "dice": "die",
+    "feet": "foot",
+    "geese": "goose",
+    "lice": "louse",
+    "men": "man",
+    "mice": "mouse",
+    "oxen": "ox",
+    "people": "person",
+    "teeth": "tooth",
+    "women": "woman",
+    "ran": "run",
+    "went": "go",
+    "gone": "go",
+    "was": "be",
+    "were": "be",
+    "been": "be",
+    "did": "do",
+    "done": "do",
+    "had": "have",
+    "has": "have",
+    "made": "make",
+    "said": "say",
+    "took": "take",
+    "taken": "take",
+    "wrote": "write",
+    "written": "write",
+}
+
+# Doubled consonants that are part of the word, not added by a suffix
+KEEP_DOUBLE = frozenset("lsz")
+
+
+def is_stem_trigger(trigger):
+    return trigger.startswith(STEM_MARKER)
+
+
+def _has_vowel(word):
+    return any(c in VOWELS for c in word)
+
+
+def _undouble(word):
+    # stopped -> stopp -> stop
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in VOWELS | KEEP_DOUBLE:
+        return word[:-1]
+
+    return word
+
+
+def _strip_suffix(word):
+    if word.endswith("sses"):
+        return word[:-2]
+
+    if word.endswith(("ies", "ied")) and len(word) > 4:
+        return word[:-3] + "y"
+
+    for suffix in ("ing", "ed"):
+        if word.endswith(suffix):
+            stem = word[: -len(suffix)]
+
+            if len(stem) >= 3 and _has_vowel(stem):
+                return _undouble(stem)
+
+            return word
+
+    if word.endswith("es") and word[:-2].endswith(("s", "x", "z", "ch", "sh")):
+        return word[:-2]
+
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")) and len(word) > 3:
+        return word[:-1]
+
+    return word
+
+
+@functools.lru_cache(maxsize=4096)
+def stem(word):
+    """Reduces an English word to a stem shared by its other forms.
+
+    This is a small set of suffix rules, not a full stemmer, so the stems
+    aren't always real words (make and making both become mak).
+    What matters is that the forms of a word end up the same.
+    """
+    # Possessives, like mouse's and users'
+    word = word[:-2] if word.endswith("'s") else word.rstrip("'")
+
+    word = IRREGULARS.get(word, word)
+    word = _strip_suffix(word)
+
+    # make and making should end up the same
+    if word.endswith("e") and len(word) > 3:
+        word = word[:-1]
+
+    return word
@@ -0,0 +1,716 @@
+import array
+import bisect
+import collections
+import itertools
+import logging
+import time
+
+from .automaton import Automaton, PREFIX, SUBSTRING, WORD, is_word_end, is_word_start
+from .bloom import BloomFilter
+from .fuzzy import FUZZY_MARKER, FuzzyIndex, is_fuzzy
+from .normalize import UNSPACED_RE, is_unspaced, normalize_phrase
+from .patterns import compile_pattern, is_pattern, literal_prefix, normalize_pattern
+from .snapshot import encode_rows
+from .stemmer import STEM_MARKER, is_stem_trigger, stem
+
+
+log = logging.getLogger("glados.triggers")
+
+# Versions are unique across every guild, so a guild that is removed
+# and added again never reuses an old version
+_versions = itertools.count(1)
+
+
+# Triggers have to be at least this long
+MIN_WORD_LENGTH = 3
+
+# Words in scripts like Chinese and Japanese are often only two characters
+MIN_UNSPACED_LENGTH = 2
+
+# Phrase triggers can have at most this many words
+MAX_PHRASE_WORDS = 5
+
+# Triggers can be at most this long, which also caps
+# how long the candidates for a database lookup get
+MAX_TRIGGER_LENGTH = 50
+
+# Global triggers are kept in the index under this guild id
+# (they have a NULL guild_id in the database)
+GLOBAL = 0
+
+
+def normalize_trigger(trigger):
+    """Normalizes a trigger into the form it's stored and matched in"""
+    trigger = trigger.strip()
+
+    if is_fuzzy(trigger):
+        return FUZZY_MARKER + normalize_phrase(trigger[len(FUZZY_MARKER) :])
+
+    if is_stem_trigger(trigger):
+        return STEM_MARKER + normalize_phrase(trigger[len(STEM_MARKER) :])
+
+    if is_pattern(trigger):
+        return normalize_pattern(trigger)
+
+    # Phrases are their normalized words joined with single spaces,
+    # which is the same form the scanner matches against
+    return normalize_phrase(trigger)
+
+
+def min_length(word):
+    """Returns how long a trigger that starts like the word has to be"""
+    return MIN_UNSPACED_LENGTH if word and is_unspaced(word[0]) else MIN_WORD_LENGTH
+
+
+def token_starts(text):
+    """Yields the offset of every token in normalized text"""
+    if not text:
+        return
+
+    yield 0
+
+    position = text.find(" ")
+
+    while position != -1:
+        yield position + 1
+        position = text.find(" ", position + 1)
+
+
+def word_starts(text):
+    """Yields every offset in normalized text that a word can start at.
+
+    That's the start of every token, plus every offset next to
+    a character from a script that doesn't use spaces.
+    """
+    if not UNSPACED_RE.search(text):
+        yield from token_starts(text)
+        return
+
+    yield 0
+
+    for i in range(1, len(text)):
+        if text[i] != " " and (text[i - 1] == " " or is_word_start(text, i)):
+            yield i
+
+
+def candidate_words(text, *, mode=PREFIX):
+    """Returns every trigger that could match the normalized text.
+
+    This is for looking triggers up without an automaton, like in the
+    database. Substring mode is treated like prefix mode here,
+    since listing every substring of a message is too much.
+    """
+    candidates = set()
+    tokens = text.split(" ")
+
+    for i in range(len(tokens)):
+        # A trigger can be a phrase of up to MAX_PHRASE_WORDS words
+        # that starts with this token
+        if mode == WORD:
+            for end in range(i + 1, min(i + MAX_PHRASE_WORDS, len(tokens)) + 1):
+                candidates.add(" ".join(tokens[i:end]))
+
+            continue
+
+        phrase = " ".join(tokens[i : i + MAX_PHRASE_WORDS])[:MAX_TRIGGER_LENGTH]
+
+        for end in range(MIN_WORD_LENGTH, len(phrase) + 1):
+            candidates.add(phrase[:end])
+
+    # Words in scripts without spaces can start and end inside a token
+    for token in tokens:
+        if not UNSPACED_RE.search(token):
+            continue
+
+        for start in word_starts(token):
+            last = min(start + MAX_TRIGGER_LENGTH, len(token))
+
+            for end in range(start + min_length(token[start]), last + 1):
+                if mode != WORD or is_word_end(token, end):
+                    candidates.add(token[start:end])
+
+    return candidates
+
+
+def in_scope(scope, channel):
+    """Returns whether a channel is in a trigger's channels and categories.
+
+    Triggers without a scope apply everywhere.
+    """
+    if not scope or channel is None:
+        return True
+
+    return channel.id in scope or getattr(channel, "category_id", None) in scope
+
+
+def prefilter_key(word):
+    # Triggers in scripts without spaces are keyed on bigrams,
+    # since their words can be as short as two characters
+    return word[: min_length(word)]
+
+
+def prefilter_keys(text, *, mode=PREFIX):
+    """Returns the keys to probe the prefilter with for the normalized text"""
+    if mode == SUBSTRING:
+        # A trigger can start anywhere, so every n-gram has to be probed
+        starts = range(len(text))
+
+    else:
+        # Phrases can start with a short word, so
+        # the keys run over into the next word
+        starts = word_starts(text)
+
+    # Only slice as much as the key needs, not the rest of the text
+    return {text[i : i + min_length(text[i])] for i in starts}
+
+
+class GuildTriggers:
+    """All the trigger words and phrases for one guild.
+
+    Every word keeps the set of users subscribed to it, which
+    doubles as its reference count. A word only leaves the automaton
+    once the last user subscribed to it removes it.
+
+    The prefix of every word is also kept in a Bloom filter,
+    so most messages without a trigger are thrown out
+    after a few hash probes instead of a full search.
+
+    Wildcard patterns are found through their literal prefix
+    in the automaton, and are only run where that prefix matched.
+
+    Fuzzy and stem triggers live in their own indexes and are
+    looked up word by word, after the exact search.
+
+    A user can scope a trigger to some channels or categories.
+    Every channel and category keeps the triggers scoped to it,
+    so a message in a channel nobody is watching skips the search.
+    """
+
+    def __init__(self, guild_id, *, error_rate=0.01):
+        self.guild_id = guild_id
+
+        # word: {user_id, ...}
+        self.words = {}
+        self.automaton = Automaton()
+        self.prefilter = BloomFilter(error_rate=error_rate)
+
+        # literal prefix: {pattern, ...}
+        self.patterns = {}
+
+        # How many triggers use each key in the automaton
+        self._keys = collections.Counter()
+
+        self.fuzzy = FuzzyIndex()
+
+        # stem: {trigger, ...}
+        self.stems = {}
+
+        # (word, user_id): frozenset of channel and category ids
+        # Subscriptions that aren't in here apply to the whole guild
+        self.scopes = {}
+
+        # channel or category id: {word: subscriber count}
+        self.channels = {}
+
+        # word: how many users subscribed to it in the whole guild
+        self.unscoped = collections.Counter()
+
+        # Changes every time a trigger is added to or removed from the guild,
+        # so copies of these structures know when they're out of date
+        self.version = next(_versions)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def add(self, word, user_id, scope=None):
+        """Subscribes a user to a word, optionally only in some channels or categories.
+
+        Subscribing again changes the scope. Returns whether the word is new to the guild.
+        """
+        users = self.words.get(word)
+
+        if users is None:
+            self.words[word] = {user_id}
+            self._add_trigger(word)
+            self._add_scope(word, user_id, scope)
+            return True
+
+        if user_id in users:
+            self._remove_scope(word, user_id)
+
+        users.add(user_id)
+        self._add_scope(word, user_id, scope)
+        return False
+
+    def remove(self, word, user_id):
+        """Unsubscribes a user from a word. Returns whether the word left the guild."""
+        users = self.words.get(word)
+
+        if users is None or user_id not in users:
+            return False
+
+        users.discard(user_id)
+        self._remove_scope(word, user_id)
+
+        if users:
+            return False
+
+        del self.words[word]
+        self._remove_trigger(word)
+        return True
+
+    def _add_scope(self, word, user_id, scope):
+        if not scope:
+            self.unscoped[word] += 1
+            return
+
+        scope = self.scopes[(word, user_id)] = frozenset(scope)
+
+        for channel_id in scope:
+            words = self.channels.setdefault(channel_id, collections.Counter())
+            words[word] += 1
+
+    def _remove_scope(self, word, user_id):
+        scope = self.scopes.pop((word, user_id), None)
+
+        if scope is None:
+            self.unscoped[word] -= 1
+
+            if not self.unscoped[word]:
+                del self.unscoped[word]
+
+            return
+
+        for channel_id in scope:
+            words = self.channels[channel_id]
+            words[word] -= 1
+
+            if not words[word]:
+                del words[word]
+
+            if not words:
+                del self.channels[channel_id]
+
+    def _add_trigger(self, word):
+        self.version = next(_versions)
+
+        if is_fuzzy(word):
+            self.fuzzy.add(word[len(FUZZY_MARKER) :])
+            return
+
+        if is_stem_trigger(word):
+            # The trigger's stem is worked out once here, not for every message
+            key = stem(word[len(STEM_MARKER) :])
+            self.stems.setdefault(key, set()).add(word)
+            return
+
+        if is_pattern(word):
+            key = literal_prefix(word)
+            self.patterns.setdefault(key, set()).add(word)
+
+        else:
+            key = word
+
+        self._keys[key] += 1
+        self.automaton.add(key)
+
+        if self.prefilter.is_full:
+            self.rebuild_prefilter(self.prefilter.capacity * 2)
+
+        else:
+            self.prefilter.add(prefilter_key(word))
+
+    def _remove_trigger(self, word):
+        self.version = next(_versions)
+
+        if is_fuzzy(word):
+            self.fuzzy.remove(word[len(FUZZY_MARKER) :])
+            return
+
+        if is_stem_trigger(word):
+            key = stem(word[len(STEM_MARKER) :])
+            self.stems[key].discard(word)
+
+            if not self.stems[key]:
+                del self.stems[key]
+
+            return
+
+        if is_pattern(word):
+            key = literal_prefix(word)
+            self.patterns[key].discard(word)
+
+            if not self.patterns[key]:
+                del self.patterns[key]
+
+        else:
+            key = word
+
+        self._keys[key] -= 1
+
+        if not self._keys[key]:
+            del self._keys[key]
+            self.automaton.remove(key)
+
+        self.prefilter.remove(prefilter_key(word))
+
+    def rebuild_prefilter(self, capacity):
+        prefilter = BloomFilter(capacity, self.prefilter.error_rate)
+
+        for word in self.words:
+            if not is_fuzzy(word) and not is_stem_trigger(word):
+                prefilter.add(prefilter_key(word))
+
+        self.prefilter = prefilter
+
+    def subscribers(self, word, channel=None):
+        """Returns the users subscribed to a word.
+
+        If a channel is given, users whose trigger is scoped
+        somewhere else are left out.
+        """
+        users = self.words.get(word, set())
+
+        if channel is None or not self.scopes:
+            return users
+
+        return {u for u in users if in_scope(self.scopes.get((word, u)), channel)}
+
+    def watches(self, channel):
+        """Returns whether any trigger applies in a channel"""
+        if self.unscoped:
+            return True
+
+        return channel.id in self.channels or getattr(channel, "category_id", None) in self.channels
+
+    def might_match(self, content, *, mode=PREFIX):
+        """Returns False if no trigger can be in the content, True if one might be"""
+        prefilter = self.prefilter
+        return any(key in prefilter for key in prefilter_keys(content, mode=mode))
+
+    def search(self, text, *, mode=PREFIX, budget=None):
+        """Yields (start, end, trigger) for every trigger in the normalized text.
+
+        The prefilter is checked first, so most messages without
+        a trigger never get to the automaton. budget is how many
+        seconds wildcard patterns can take in total. Once it runs out,
+        the rest of the patterns are skipped, but plain words are still found.
+        """
+        if self.automaton and self.might_match(text, mode=mode):
+            yield from self._search_exact(text, mode=mode, budget=budget)
+
+        if self.fuzzy or self.stems:
+            yield from self._search_tokens(text)
+
+    def _search_exact(self, text, *, mode, budget):
+        deadline = time.perf_counter() + budget if budget else None
+        whole_word = mode == WORD
+        out_of_time = False
+
+        for start, end, key in self.automaton.iter_matches(text):
+            if mode != SUBSTRING and not is_word_start(text, start):
+                continue
+
+            if key in self.words and not (whole_word and not is_word_end(text, end)):
+                yield start, end, key
+
+            if out_of_time:
+                continue
+
+            for pattern in self.patterns.get(key, ()):
+                if deadline and time.perf_counter() > deadline:
+                    log.warning(
+                        f"Ran out of time matching patterns in guild {self.guild_id}, skipping the rest"
+                    )
+                    out_of_time = True
+                    break
+
+                compiled = compile_pattern(pattern)
+                match_end = compiled.match(
+                    text, start, whole_word=whole_word, deadline=deadline
+                )
+
+                if match_end is not None:
+                    yield start, match_end, pattern
+
+    def _search_tokens(self, text):
+        position = 0
+        fuzzy_lookups = {}
+
+        for token in text.split(" "):
+            end = position + len(token)
+
+            if self.fuzzy:
+                words = fuzzy_lookups.get(token)
+
+                if words is None:
+                    words = fuzzy_lookups[token] = self.fuzzy.lookup(token)
+
+                for word in words:
+                    yield position, end, FUZZY_MARKER + word
+
+            if self.stems:
+                for trigger in self.stems.get(stem(token), ()):
+                    yield position, end, trigger
+
+            position = end + 1
+
+
+def _sorted_ids(ids):
+    return array.array("Q", sorted(ids))
+
+
+def _contains(ids, value):
+    index = bisect.bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+class GlobalTriggers(GuildTriggers):
+    """Triggers that apply in every guild their users are in.
+
+    Every word is only stored once, no matter how many guilds it applies in.
+    Each word carries a sorted array of the guilds it applies in,
+    which is every guild at least one of its users is a member of.
+    The guilds a user is in have to be set with :meth:`set_user_guilds`,
+    since the index doesn't know about members.
+    """
+
+    def __init__(self, *, error_rate=0.01):
+        super().__init__(GLOBAL, error_rate=error_rate)
+
+        # user_id: sorted array of guild ids
+        self.user_guilds = {}
+
+        # user_id: {word, ...}
+        self.user_words = {}
+
+        # word: sorted array of guild ids
+        self.word_guilds = {}
+
+        # guild_id: how many words apply in the guild
+        self.guild_counts = collections.Counter()
+
+    def add(self, word, user_id, scope=None):
+        # Global triggers can't be scoped to channels
+        added = super().add(word, user_id)
+
+        self.user_words.setdefault(user_id, set()).add(word)
+        self._update_word(word)
+
+        return added
+
+    def remove(self, word, user_id):
+        removed = super().remove(word, user_id)
+
+        words = self.user_words.get(user_id)
+
+        if words is not None:
+            words.discard(word)
+
+            if not words:
+                del self.user_words[user_id]
+                self.user_guilds.pop(user_id, None)
+
+        self._update_word(word)
+
+        return removed
+
+    def set_user_guilds(self, user_id, guild_ids):
+        """Sets the guilds a user is in. Only users with global triggers are kept."""
+        if user_id not in self.user_words:
+            return
+
+        self.user_guilds[user_id] = _sorted_ids(guild_ids)
+
+        for word in self.user_words[user_id]:
+            self._update_word(word)
+
+    def _update_word(self, word):
+        old = self.word_guilds.pop(word, ())
+
+        for guild_id in old:
+            self.guild_counts[guild_id] -= 1
+
+            if not self.guild_counts[guild_id]:
+                del self.guild_counts[guild_id]
+
+        guild_ids = set()
+
+        for user_id in self.words.get(word, ()):
+            guild_ids.update(self.user_guilds.get(user_id, ()))
+
+        if not guild_ids:
+            return
+
+        self.word_guilds[word] = _sorted_ids(guild_ids)
+
+        for guild_id in guild_ids:
+            self.guild_counts[guild_id] += 1
+
+    def applies_in(self, guild_id):
+        """Returns whether any global trigger applies in a guild"""
+        return guild_id in self.guild_counts
+
+    def watches(self, channel):
+        return self.applies_in(channel.guild.id)
+
+    def subscribers(self, word, channel=None):
+        users = self.words.get(word, set())
+
+        if channel is None:
+            return users
+
+        guild_id = channel.guild.id
+
+        if not _contains(self.word_guilds.get(word, ()), guild_id):
+            return set()
+
+        return {u for u in users if _contains(self.user_guilds.get(u, ()), guild_id)}
+
+
+def find_trigger(text, trigger, *, mode=PREFIX):
+    """Yields (start, end) for every match of one trigger in the normalized text"""
+    matcher = GuildTriggers(None)
+    matcher.add(trigger, None)
+
+    for start, end, _ in matcher.search(text, mode=mode):
+        yield start, end
+
+
+class TriggerIndex:
+    """In-memory index of guild_id -> word -> subscribed user ids.
+
+    Global triggers are kept as one more guild, under :data:`GLOBAL`.
+
+    The index can start from a :class:`Snapshot`. Guilds in the
+    snapshot are only decoded the first time they are looked up.
+    """
+
+    def __init__(self, *, error_rate=0.01):
+        self.guilds = {}
+        self.ready = False
+
+        # Target false positive rate for the prefilters
+        self.error_rate = error_rate
+
+        self.snapshot = None
+
+        # Guilds in the snapshot that haven't been decoded yet
+        self._pending = set()
+
+    def __len__(self):
+        words = sum(len(g) for g in self.guilds.values())
+        return words + sum(self.snapshot.word_count(g) for g in self._pending)
+
+    @property
+    def row_count(self):
+        """How many (word, user, guild) rows are in the index"""
+        rows = sum(len(u) for g in self.guilds.values() for u in g.words.values())
+        return rows + sum(self.snapshot.row_count(g) for g in self._pending)
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+    def get(self, guild_id):
+        guild = self.guilds.get(guild_id)
+
+        if guild is None and guild_id in self._pending:
+            guild = self._load_from_snapshot(guild_id)
+
+        return guild
+
+    def _create(self, guild_id):
+        if guild_id == GLOBAL:
+            guild = GlobalTriggers(error_rate=self.error_rate)
+
+        else:
+            guild = GuildTriggers(guild_id, error_rate=self.error_rate)
+
+        self.guilds[guild_id] = guild
+        return guild
+
+    def _load_from_snapshot(self, guild_id):
+        self._pending.discard(guild_id)
+        guild = self._create(guild_id)
+
+        for word, user_id, scope in self.snapshot.iter_rows(guild_id):
+            guild.add(word, user_id, scope)
+
+        # Everything has been decoded, so the file isn't needed anymore
+        if not self._pending:
+            self.detach_snapshot()
+
+        return guild
+
+    def attach_snapshot(self, snapshot):
+        """Starts the index from a snapshot. The index is ready right away."""
+        self.detach_snapshot()
+        self.guilds.clear()
+
+        self.snapshot = snapshot
+        self._pending = set(snapshot.guilds)
+        self.ready = True
+
+    def detach_snapshot(self):
+        if self.snapshot:
+            self.snapshot.close()
+
+        self.snapshot = None
+        self._pending.clear()
+
+    def sections(self):
+        """Yields (guild_id, rows, words, section) for writing a snapshot"""
+        for guild_id, guild in self.guilds.items():
+            rows = sum(len(u) for u in guild.words.values())
+            yield guild_id, rows, len(guild.words), encode_rows(guild.words, guild.scopes)
+
+        # Guilds that were never decoded are copied straight from the old snapshot
+        for guild_id in self._pending:
+            yield (
+                guild_id,
+                self.snapshot.row_count(guild_id),
+                self.snapshot.word_count(guild_id),
+                self.snapshot.section(guild_id),
+            )
+
+    def load(self, records):
+        """Loads the index from (word, user_id, guild_id, channel_ids) records"""
+        self.detach_snapshot()
+        self.guilds.clear()
+
+        for word, user_id, guild_id, channel_ids in records:
+            self.add(guild_id, word, user_id, channel_ids)
+
+        self.ready = True
+
+    def add(self, guild_id, word, user_id, scope=None):
+        """Subscribes a user to a word. A guild_id of None adds a global trigger."""
+        if guild_id is None:
+            guild_id = GLOBAL
+
+        guild = self.get(guild_id)
+
+        if guild is None:
+            guild = self._create(guild_id)
+
+        return guild.add(word, user_id, scope)
+
+    def remove(self, guild_id, word, user_id):
+        if guild_id is None:
+            guild_id = GLOBAL
+
+        guild = self.get(guild_id)
+
+        if guild is None:
+            return False
+
+        removed = guild.remove(word, user_id)
+
+        if not guild.words:
+            del self.guilds[guild_id]
+
+        return removed
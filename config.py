@@ -26,6 +26,70 @@ class Config:
 
         self.debug = self._get("debug", optional=True, default=False)
 
+        # How a trigger has to line up with the words in a message
+        # prefix (default), word, or substring
+        self.match_mode = self._get("match-mode", optional=True, default="prefix")
+
+        # Target false positive rate for the per-guild trigger prefilters
+        self.prefilter_error_rate = self._get(
+            "prefilter-error-rate", optional=True, default=0.01
+        )
+
+        # How long wildcard triggers can take per message, in milliseconds
+        self.pattern_time_budget = self._get(
+            "pattern-time-budget", optional=True, default=10
+        )
+
+        # Matching long messages in guilds with lots of triggers
+        # can be moved to a process pool. 0 workers turns this off.
+        self.offload_workers = self._get("offload-workers", optional=True, default=0)
+        self.offload_min_length = self._get(
+            "offload-min-length", optional=True, default=1000
+        )
+        self.offload_min_triggers = self._get(
+            "offload-min-triggers", optional=True, default=1000
+        )
+
+        # How long after a message is sent its edits are scanned, in seconds
+        self.edit_rescan_window = self._get(
+            "edit-rescan-window", optional=True, default=600
+        )
+
+        # How many recent messages are remembered for edit rescans at most
+        self.edit_rescan_size = self._get(
+            "edit-rescan-size", optional=True, default=5000
+        )
+
+        # How many match results to keep for repeated messages, like spam
+        self.match_cache_size = self._get(
+            "match-cache-size", optional=True, default=1024
+        )
+
+        # How many recent messages each channel keeps for notification context,
+        # and how many of the most active watched channels keep them
+        self.context_buffer_depth = self._get(
+            "context-buffer-depth", optional=True, default=20
+        )
+        self.context_buffer_channels = self._get(
+            "context-buffer-channels", optional=True, default=100
+        )
+
+        # Highlights for a user within this many seconds are sent
+        # together in one DM. 0 sends each one right away.
+        self.digest_window = self._get("digest-window", optional=True, default=0)
+
+        # How many DMs can be sent per second on average, and in a burst
+        self.delivery_rate = self._get("delivery-rate", optional=True, default=5)
+        self.delivery_burst = self._get("delivery-burst", optional=True, default=10)
+
+        # The most messages the backfill command scans
+        self.backfill_limit = self._get("backfill-limit", optional=True, default=1000)
+
+        # Where to keep the trigger snapshot that makes restarts fast
+        self.snapshot_path = self._get(
+            "snapshot-path", optional=True, default="triggers.snapshot"
+        )
+
     def _get(self, key, *, optional=False, default=None):
         # Set the attribute
         value = self._data.get(key) or default